@@ -0,0 +1,275 @@
+"""JSON API to solve sheets from scripts, without the HTML pages.
+
+``POST /api/v1/solve`` takes a JSON object with:
+
+- ``csv``: the content of the DEDICA CSV, or ``upload``: the id (content
+  hash) of a file uploaded before through ``/config``;
+- ``targets``: a list of ``{"project", "wp", "hours"}`` (-1 for no minimum),
+  the projects left out get 0 hours, as in the web form;
+- ``minimums``: the daily minimum of the activities by form name
+  (``__teaching__``, ``__other_id__``, ``__other__``, ``__lessons__``);
+- ``caps``: ``{"daily", "weekly"}``, by default DAILY_MAX and WEEKLY_MAX;
+- ``solver``, ``fill`` and ``seed`` (0 by default, so the answer is always the same);
+- ``weights``: a list of ``{"project", "wp", "weight"}``, the weight of the
+  projects without minimum in the random, proportional and blocks fills (1
+  for the projects left out);
+- ``slots``: ``{"slot", "min_block", "max_block", "max_projects"}`` to assign
+  the hours in whole slots and blocks, by default from SLOT_HOURS (see
+  engine.SlotRules);
+- ``format``: ``json`` (the hours of every row and working day) or ``csv``
+  (the solved CSV bytes).
+
+``POST /api/v1/preview`` takes the same object and only answers the total
+hours of every row, like the preview of the web form.
+
+The answers carry an ETag of the request and are kept for a while, so a
+repeated request is answered from memory, or with 304 if the client sends the
+ETag back. Large answers are gzip compressed when the client accepts it.
+"""
+import collections
+import gzip
+import hashlib
+import io
+import json
+import os
+import random
+import threading
+
+from flask import Blueprint, Response, current_app, jsonify, request
+
+import csvio
+from cache import uploads
+from engine import ACTIVITY_CODES, FILL_STRATEGIES, MAX_HOUR_DAY, MAX_HOUR_WEEK, SlotRules, SolverException
+from main import SOLVERS, generate_questions, solve_month
+
+API_CACHE = 64
+GZIP_MIN_BYTES = 1024
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+
+class ApiError(Exception):
+	pass
+
+
+class ResponseCache:
+	"""The last answers by ETag"""
+
+	def __init__(self, max_entries=API_CACHE):
+		self.max_entries = max_entries
+		self._entries = collections.OrderedDict()
+		self._lock = threading.Lock()
+
+	def get(self, etag):
+		with self._lock:
+			entry = self._entries.get(etag)
+			if entry is not None:
+				self._entries.move_to_end(etag)
+			return entry
+
+	def put(self, etag, entry):
+		with self._lock:
+			self._entries[etag] = entry
+			self._entries.move_to_end(etag)
+			while len(self._entries) > self.max_entries:
+				self._entries.popitem(last=False)
+
+
+responses = ResponseCache()
+
+
+def load_sheet(payload):
+	"""Returns the parsed upload of the csv or upload of the payload"""
+	if payload.get('csv') is not None:
+		try:
+			data = payload['csv'].encode(csvio.ENCODING)
+		except (AttributeError, UnicodeEncodeError):
+			raise ApiError("csv tiene que ser el texto del CSV en ISO-8859-1")
+		return parse_sheet(uploads.load_bytes, 'api.csv', data)
+	if payload.get('upload'):
+		path = current_app.config['UPLOAD_STORE'].path(str(payload['upload']))
+		if path is None:
+			raise ApiError(f"No existe el fichero subido {payload['upload']}")
+		return parse_sheet(uploads.load, path)
+	raise ApiError("Falta csv o upload")
+
+
+def parse_sheet(load, *args):
+	# any error of the parser is an error of the file sent
+	try:
+		return load(*args)
+	except Exception as e:
+		raise ApiError(f"Error leyendo el CSV: {e}")
+
+
+def parse_targets(payload, df):
+	"""Returns hours_by_project and the activity minimums of the payload"""
+	hours_by_project = {key: 0 for key in generate_questions(df) if key[0] not in ACTIVITY_CODES and key[0] != '__empty__'}
+	targets = payload.get('targets') or []
+	if not isinstance(targets, list):
+		raise ApiError("targets tiene que ser una lista de objetivos")
+	for target in targets:
+		try:
+			key, hours = (str(target['project']), int(target.get('wp', -1))), float(target['hours'])
+		except (KeyError, TypeError, ValueError):
+			raise ApiError("Cada objetivo necesita project, wp y hours")
+		if key not in hours_by_project:
+			raise ApiError(f"El proyecto {key[0]} (WP {key[1]}) no está en la hoja")
+		hours_by_project[key] = hours
+	other = {key: -1 for key in ACTIVITY_CODES}
+	minimums = payload.get('minimums') or {}
+	if not isinstance(minimums, dict):
+		raise ApiError("minimums tiene que ser un objeto con el mínimo diario de cada actividad")
+	for key, value in minimums.items():
+		if key not in ACTIVITY_CODES:
+			raise ApiError(f"Actividad desconocida: {key}")
+		other[key] = parse_number(value, f"El mínimo de {key}")
+	return hours_by_project, other
+
+
+def parse_weights(payload, hours_by_project):
+	"""Returns the weights of the projects of the payload by key, or None without them"""
+	weights = payload.get('weights')
+	if not weights:
+		return None
+	if not isinstance(weights, list):
+		raise ApiError("weights tiene que ser una lista de pesos")
+	by_key = {}
+	for weight in weights:
+		try:
+			key, value = (str(weight['project']), int(weight.get('wp', -1))), float(weight['weight'])
+		except (KeyError, TypeError, ValueError, AttributeError):
+			raise ApiError("Cada peso necesita project, wp y weight")
+		if key not in hours_by_project:
+			raise ApiError(f"El proyecto {key[0]} (WP {key[1]}) no está en la hoja")
+		if not value > 0:
+			raise ApiError(f"El peso de {key[0]} (WP {key[1]}) tiene que ser positivo")
+		by_key[key] = value
+	return by_key
+
+
+def parse_number(value, name):
+	"""Returns a number of the payload as a float"""
+	try:
+		return float(value)
+	except (TypeError, ValueError):
+		raise ApiError(f"{name} tiene que ser un número")
+
+
+def parse_slots(payload):
+	"""Returns the SlotRules of the payload, those of the environment without it"""
+	if payload.get('slots') is None:
+		return SlotRules.from_env()
+	slots = payload['slots']
+	try:
+		return SlotRules(float(slots.get('slot', 0.5)), float(slots.get('min_block') or 0.0),
+						 None if slots.get('max_block') is None else float(slots['max_block']),
+						 None if slots.get('max_projects') is None else int(slots['max_projects']))
+	except (AttributeError, TypeError, ValueError):
+		raise ApiError("slots tiene que tener slot, min_block, max_block y max_projects numéricos")
+	except SolverException as e:
+		raise ApiError(str(e))
+
+
+def request_etag(digest, payload):
+	# the sheet by its hash and every other field of the payload
+	fields = {key: value for key, value in payload.items() if key not in ('csv', 'upload')}
+	text = json.dumps(fields, sort_keys=True, separators=(',', ':'))
+	return hashlib.sha256(f"{digest}\0{text}".encode('utf-8')).hexdigest()[:32]
+
+
+def solve_payload(upload, payload):
+	"""Solves a payload and returns the body and mimetype of the answer"""
+	hours_by_project, other = parse_targets(payload, upload.df)
+	caps = payload.get('caps') or {}
+	if not isinstance(caps, dict):
+		raise ApiError("caps tiene que ser un objeto con daily y weekly")
+	daily_max = parse_number(caps.get('daily', os.environ.get('DAILY_MAX', MAX_HOUR_DAY)), "caps.daily")
+	weekly_max = parse_number(caps.get('weekly', os.environ.get('WEEKLY_MAX', MAX_HOUR_WEEK)), "caps.weekly")
+	solver, fill = payload.get('solver', 'greedy'), payload.get('fill', 'random')
+	if solver not in SOLVERS or not isinstance(fill, str) or fill not in FILL_STRATEGIES:
+		raise ApiError(f"solver tiene que ser uno de {SOLVERS} y fill uno de {list(FILL_STRATEGIES)}")
+	try:
+		seed = int(payload.get('seed', 0))
+	except (TypeError, ValueError):
+		raise ApiError("seed tiene que ser un número entero")
+	slots = parse_slots(payload)
+	weights = parse_weights(payload, hours_by_project)
+
+	info = {}
+	solved_df = solve_month(upload.frame(), upload.working_days, upload.num_working_days, other, hours_by_project,
+							daily_max=daily_max, weekly_max=weekly_max, solver=solver, weeks=upload.weeks,
+							rng=random.Random(seed), fill=fill, weights=weights, slots=slots, info=info)
+	if payload.get('format', 'json') == 'csv':
+		output = io.BytesIO()
+		csvio.write_df(solved_df, output)
+		return output.getvalue(), f'text/csv; charset={csvio.ENCODING}'
+
+	hours = solved_df[upload.working_days].to_numpy(dtype=float)
+	rows = [{'project': project, 'wp': int(wp), 'activity_id': int(code), 'total': float(row.sum())}
+			for project, wp, code, row in zip(solved_df['Proyecto'], solved_df['Working Package'],
+											  solved_df['Id Actividad'], hours)]
+	body = {'rows': rows, 'solver': solver, 'solver_used': info['solver_used'], 'fill': fill, 'seed': seed,
+			'caps': {'daily': daily_max, 'weekly': weekly_max}}
+	if slots is not None:
+		body['slots'] = {'slot': slots.slot, 'min_block': slots.min_block, 'max_block': slots.max_block,
+						 'max_projects': slots.max_projects}
+	if payload.get('format', 'json') == 'totals':
+		body['assigned_total'] = float(hours.sum())
+		body['remaining'] = daily_max * upload.num_working_days - body['assigned_total']
+	else:
+		body['working_days'] = upload.working_days
+		for row, day_hours in zip(rows, hours):
+			row['hours'] = day_hours.tolist()
+	return json.dumps(body, ensure_ascii=False, separators=(',', ':')).encode('utf-8'), 'application/json'
+
+
+def make_response(entry, etag):
+	# entry is [body, mimetype, gzipped body or None], the gzipped body is made once
+	body, mimetype = entry[0], entry[1]
+	if len(body) >= GZIP_MIN_BYTES and 'gzip' in request.accept_encodings:
+		if entry[2] is None:
+			entry[2] = gzip.compress(body, compresslevel=6)
+		response = Response(entry[2], mimetype=mimetype)
+		response.headers['Content-Encoding'] = 'gzip'
+	else:
+		response = Response(body, mimetype=mimetype)
+	response.set_etag(etag)
+	response.headers['Vary'] = 'Accept-Encoding'
+	return response
+
+
+@api.route('/solve', methods=['POST'])
+def solve():
+	payload = request.get_json(silent=True)
+	if not isinstance(payload, dict):
+		return jsonify({'error': 'El cuerpo tiene que ser un objeto JSON'}), 400
+	return answer(payload)
+
+
+@api.route('/preview', methods=['POST'])
+def preview():
+	payload = request.get_json(silent=True)
+	if not isinstance(payload, dict):
+		return jsonify({'error': 'El cuerpo tiene que ser un objeto JSON'}), 400
+	return answer(dict(payload, format='totals'))
+
+
+def answer(payload):
+	# from the cache of answers when the same request was solved before
+	try:
+		upload = load_sheet(payload)
+		etag = request_etag(upload.digest, payload)
+		if etag in request.if_none_match:
+			response = Response(status=304)
+			response.set_etag(etag)
+			return response
+		entry = responses.get(etag)
+		if entry is None:
+			entry = list(solve_payload(upload, payload)) + [None]
+			responses.put(etag, entry)
+		return make_response(entry, etag)
+	except ApiError as e:
+		return jsonify({'error': str(e)}), 400
+	except SolverException as e:
+		return jsonify({'error': str(e), 'violations': [v.to_dict() for v in e.violations]}), 422
@@ -0,0 +1,231 @@
+"""Solves the sheets of many people at once.
+
+The input is a directory of CSVs, a ZIP with them or a manifest listing them.
+The manifest is a ``;`` separated CSV with the columns ``Fichero``,
+``Proyecto``, ``Working Package`` and ``Horas``; a ``*`` file applies to every
+sheet, and the activities use their form names (``__teaching__``...) as
+project with the daily minimum as hours. Projects without hours get 0, like
+in the web form. An optional ``Peso`` column gives the weight of a project in
+the random, proportional and blocks fills (1 when empty). Without a seed a
+new one is drawn for the batch; it is written to the summary with the state
+of every sheet, so the batch can be reproduced.
+
+Run with ``python batch.py <directorio|zip|manifiesto> [-o results] [-w workers]``.
+"""
+import argparse
+import concurrent.futures
+import csv
+import io
+import multiprocessing
+import os
+import random
+import zipfile
+
+import csvio
+from core import SOLVERS, project_keys, solve_sheet_matrix
+from engine import ACTIVITY_CODES, FILL_STRATEGIES, MAX_HOUR_DAY, SlotRules, SolverException
+
+MANIFEST_COLUMNS = ["Fichero", "Proyecto", "Working Package", "Horas"]
+WEIGHT_COLUMN = "Peso"
+SUMMARY_FILE = "resumen.csv"
+
+
+def read_manifest(_file):
+	"""Returns the targets and the weights of the manifest by file: {fichero: {(proyecto, wp): horas}}"""
+	targets, weights = {}, {}
+	reader = csv.DictReader(_file, delimiter=';')
+	missing = [c for c in MANIFEST_COLUMNS if c not in (reader.fieldnames or [])]
+	if missing:
+		raise SolverException(f"Faltan columnas en el manifiesto: {', '.join(missing)}")
+	for row in reader:
+		key = (row["Proyecto"].strip(), int(row["Working Package"] or -1))
+		targets.setdefault(row["Fichero"].strip(), {})[key] = float(row["Horas"].replace(',', '.'))
+		if (row.get(WEIGHT_COLUMN) or '').strip():
+			weight = float(row[WEIGHT_COLUMN].replace(',', '.'))
+			if weight <= 0:
+				raise SolverException(f"El peso de {key[0]} (WP {key[1]}) tiene que ser positivo")
+			weights.setdefault(row["Fichero"].strip(), {})[key] = weight
+	return targets, weights
+
+
+def load_sources(_path):
+	"""Returns the sheets to solve as (name, bytes) and the targets and weights of the manifest, if any"""
+	sources, targets, weights = [], {}, {}
+	if os.path.isdir(_path):
+		for name in sorted(os.listdir(_path)):
+			if name.lower().endswith('.csv'):
+				with open(os.path.join(_path, name), 'rb') as f:
+					sources.append((name, f.read()))
+	elif zipfile.is_zipfile(_path):
+		sources, targets, weights = load_zip(_path)
+	else:
+		# a manifest: the files are relative to it
+		with open(_path, encoding='utf-8') as f:
+			targets, weights = read_manifest(f)
+		folder = os.path.dirname(os.path.abspath(_path))
+		for name in targets:
+			if name != '*':
+				with open(os.path.join(folder, name), 'rb') as f:
+					sources.append((name, f.read()))
+	return sources, targets, weights
+
+
+def load_zip(_file):
+	"""Returns the sheets of a ZIP and the targets and weights of its manifest.csv, if any"""
+	sources, targets, weights = [], {}, {}
+	with zipfile.ZipFile(_file) as archive:
+		for name in sorted(archive.namelist()):
+			if not name.lower().endswith('.csv') or name.endswith('/'):
+				continue
+			if os.path.basename(name) == 'manifest.csv':
+				targets, weights = read_manifest(io.TextIOWrapper(archive.open(name), encoding='utf-8'))
+			else:
+				sources.append((os.path.basename(name), archive.read(name)))
+	return sources, targets, weights
+
+
+def person_targets(_keys, _targets, _name):
+	"""Splits the targets of a sheet with the given project keys into hours_by_project and other activities"""
+	hours = dict(_targets.get('*', {}))
+	hours.update(_targets.get(_name, {}))
+	hours_by_project, other_activities = {}, {key: -1 for key in ACTIVITY_CODES}
+	for key in _keys:
+		hours_by_project[key] = hours.get(key, 0)
+	for key in ACTIVITY_CODES:
+		if (key, -1) in hours:
+			other_activities[key] = hours[(key, -1)]
+	return hours_by_project, other_activities
+
+
+def person_weights(_weights, _name):
+	"""Returns the weights of the projects of a sheet, those of ``*`` and its own, or None without any"""
+	weights = dict(_weights.get('*', {}))
+	weights.update(_weights.get(_name, {}))
+	return weights or None
+
+
+def solve_sheet(_name, _data, _targets, daily_max=MAX_HOUR_DAY, solver="greedy", seed=None, fill="random", slots=None,
+				weights=None):
+	"""Solves one sheet and returns its name, the solved CSV bytes and the error, if any"""
+	try:
+		# on plain arrays, so the worker processes never load pandas
+		sheet = csvio.load_sheet(io.BytesIO(_data))
+		hours_by_project, other_activities = person_targets(project_keys(sheet.row_keys, sheet.activity_ids), _targets,
+															_name)
+		rng = random.Random(seed)
+		solved = solve_sheet_matrix(sheet.working_hours(), sheet.row_keys, sheet.activity_ids, sheet.working_days,
+									sheet.num_working_days, other_activities, hours_by_project, daily_max=daily_max,
+									solver=solver, weeks=sheet.weeks, rng=rng, fill=fill,
+									weights=person_weights(weights or {}, _name), other_hours=sheet.other_hours(),
+									slots=slots)
+		output = io.BytesIO()
+		sheet.write(output, solved)
+		return _name, output.getvalue(), None
+	except SolverException as e:
+		return _name, None, str(e)
+	except Exception as e:
+		return _name, None, f"Error leyendo el CSV: {e}"
+
+
+def _solve_sheet(args):
+	return solve_sheet(*args)
+
+
+def new_seed():
+	"""Returns a new seed for a batch, as /solve draws one for a sheet"""
+	return random.SystemRandom().randrange(2 ** 31)
+
+
+def solve_batch(_sources, _targets, workers=None, daily_max=MAX_HOUR_DAY, solver="greedy", seed=None, fill="random",
+				slots=None, weights=None):
+	"""Solves the sheets in parallel processes and returns (name, csv bytes, error) for each one, in order.
+
+	Every sheet is solved with its own random.Random(seed); pass the seed of
+	new_seed() to record it, as without one every sheet gets a different one.
+	"""
+	workers = workers or os.cpu_count() or 1
+	jobs = [(name, data, _targets, daily_max, solver, seed, fill, slots, weights) for name, data in _sources]
+	if workers == 1 or len(jobs) <= 1:
+		return [_solve_sheet(job) for job in jobs]
+	chunksize = max(1, len(jobs) // (workers * 4))
+	# spawned, as a child forked from the threads of the web app can inherit a held lock
+	with concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+												mp_context=multiprocessing.get_context('spawn')) as executor:
+		return list(executor.map(_solve_sheet, jobs, chunksize=chunksize))
+
+
+def summary(_results, seed=None):
+	"""Returns the text of the summary report of a batch, with the seed of every sheet"""
+	output = io.StringIO()
+	writer = csv.writer(output, delimiter=';', lineterminator='\n')
+	writer.writerow(["Fichero", "Estado", "Mensaje", "Semilla"])
+	for name, _, error in _results:
+		writer.writerow([name, "error" if error else "ok", (error or "").replace("\n", " ").strip(),
+						 "" if seed is None else seed])
+	return output.getvalue()
+
+
+def output_name(_name):
+	return f"solved_{os.path.splitext(_name)[0]}.csv"
+
+
+def write_results(_results, _folder, seed=None):
+	"""Writes the solved sheets and the summary report to a folder"""
+	os.makedirs(_folder, exist_ok=True)
+	for name, data, error in _results:
+		if error is None:
+			with open(os.path.join(_folder, output_name(name)), 'wb') as f:
+				f.write(data)
+	with open(os.path.join(_folder, SUMMARY_FILE), 'w', encoding='utf-8') as f:
+		f.write(summary(_results, seed=seed))
+
+
+def zip_results(_results, seed=None):
+	"""Returns a ZIP with the solved sheets and the summary report"""
+	output = io.BytesIO()
+	with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as archive:
+		for name, data, error in _results:
+			if error is None:
+				archive.writestr(output_name(name), data)
+		archive.writestr(SUMMARY_FILE, summary(_results, seed=seed))
+	return output.getvalue()
+
+
+def add_slot_arguments(_parser):
+	"""Adds the options of the slot allocation mode, see engine.SlotRules"""
+	_parser.add_argument("--slot", type=float, default=None, help="tamaño de la franja en horas (SLOT_HOURS)")
+	_parser.add_argument("--min-block", type=float, default=None, help="horas mínimas de un proyecto en un día")
+	_parser.add_argument("--max-block", type=float, default=None, help="horas máximas de un proyecto en un día")
+	_parser.add_argument("--max-projects", type=int, default=None, help="proyectos como mucho en un día")
+
+
+def slot_rules(_parser, _args):
+	"""Returns the SlotRules of the command line options, those of the environment without --slot"""
+	try:
+		if _args.slot is None:
+			return SlotRules.from_env()
+		return SlotRules(_args.slot, _args.min_block or 0.0, _args.max_block, _args.max_projects)
+	except SolverException as e:
+		_parser.error(str(e))
+
+
+if __name__ == '__main__':
+	arg_parser = argparse.ArgumentParser(description="Resuelve las hojas de varias personas a la vez.")
+	arg_parser.add_argument("input", help="directorio, ZIP o manifiesto con los CSV")
+	arg_parser.add_argument("-o", "--output", default="results", help="directorio de salida")
+	arg_parser.add_argument("-w", "--workers", type=int, default=None, help="procesos (por defecto, uno por núcleo)")
+	arg_parser.add_argument("-s", "--solver", choices=SOLVERS, default="greedy")
+	arg_parser.add_argument("--seed", type=int, default=None, help="semilla (por defecto, una nueva en el resumen)")
+	arg_parser.add_argument("--fill", choices=list(FILL_STRATEGIES), default="random",
+							help="reparto de los proyectos sin mínimo")
+	add_slot_arguments(arg_parser)
+	args = arg_parser.parse_args()
+
+	sources, targets, weights = load_sources(args.input)
+	seed = new_seed() if args.seed is None else args.seed
+	results = solve_batch(sources, targets, workers=args.workers, daily_max=float(os.environ.get('DAILY_MAX', MAX_HOUR_DAY)),
+						  solver=args.solver, seed=seed, fill=args.fill, slots=slot_rules(arg_parser, args),
+						  weights=weights)
+	write_results(results, args.output, seed=seed)
+	failed = [name for name, _, error in results if error]
+	print(f"{len(results) - len(failed)} hojas resueltas, {len(failed)} con errores. Resumen en {os.path.join(args.output, SUMMARY_FILE)}")
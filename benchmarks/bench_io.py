@@ -0,0 +1,69 @@
+"""Parse and serialise time and peak memory of the pandas path against csvio.
+
+Run with ``python -m benchmarks.bench_io [filas] [meses]``.
+"""
+import io
+import sys
+import time
+import tracemalloc
+
+import csvio
+from benchmarks.generator import make_sheet
+from main import normalize_hours, read_df, transform_df_to_str_types
+
+
+def make_rows(rows, months=1):
+	"""Returns a CSV with about ``rows`` rows, as several people concatenated in one export"""
+	lines = []
+	person = 0
+	while len(lines) < rows + 1:
+		csv, _ = make_sheet(months=months, projects=10, seed=person)
+		sheet = csv.splitlines()
+		lines.extend(sheet[0 if not lines else 1:])
+		person += 1
+	return ("\n".join(lines[:rows + 1]) + "\n").encode('iso-8859-1')
+
+
+def measure(fn, *args):
+	tracemalloc.start()
+	start = time.perf_counter()
+	result = fn(*args)
+	elapsed = time.perf_counter() - start
+	peak = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+	return result, elapsed, peak
+
+
+def pandas_read(data):
+	df, working_days, _ = read_df(io.BytesIO(data))
+	return normalize_hours(df, working_days), working_days
+
+
+def pandas_write(df, working_days):
+	output = io.BytesIO()
+	transform_df_to_str_types(df, working_days).to_csv(output, index=False, sep=";", encoding='iso-8859-1')
+	return output.getvalue()
+
+
+def csvio_read(data):
+	df, working_days, _ = csvio.read_df(io.BytesIO(data))
+	return df, working_days
+
+
+def csvio_write(df, working_days):
+	output = io.BytesIO()
+	csvio.write_df(df, output)
+	return output.getvalue()
+
+
+if __name__ == '__main__':
+	rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+	months = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+	data = make_rows(rows, months)
+	print(f"{rows} filas, {months} meses, {len(data) / 1e6:.1f} MB")
+	print(f"{'ruta':>8} {'operación':>10} {'segundos':>9} {'pico MB':>8}")
+	for name, read, write in [("pandas", pandas_read, pandas_write), ("csvio", csvio_read, csvio_write)]:
+		(df, working_days), elapsed, peak = measure(read, data)
+		print(f"{name:>8} {'lectura':>10} {elapsed:>9.3f} {peak / 1e6:>8.1f}")
+		_, elapsed, peak = measure(write, df, working_days)
+		print(f"{name:>8} {'escritura':>10} {elapsed:>9.3f} {peak / 1e6:>8.1f}")
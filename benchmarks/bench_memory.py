@@ -0,0 +1,68 @@
+"""Memory held by the sheets of a department: the pandas frames against csvio.Sheet.
+
+``--people`` synthetic sheets of ``--months`` months are parsed and all kept,
+as the planner keeps the months of a year, in every representation:
+
+- ``pandas``: the frame of main.read_df, day columns as read by pandas;
+- ``frame``: the float frame of the uploads cache (csvio.read_df);
+- ``sheet``: csvio.Sheet, row data as codes and packed hours.
+
+The table shows the memory still held once they are parsed and the peak
+while parsing, both traced with tracemalloc.
+
+Run with ``python -m benchmarks.bench_memory [-p 300] [-m 1]``.
+"""
+import argparse
+import gc
+import io
+import tracemalloc
+
+import csvio
+from benchmarks.generator import make_sheet
+from main import normalize_hours, read_df
+
+
+def pandas_frame(_data):
+	df, working_days, _ = read_df(io.BytesIO(_data))
+	return normalize_hours(df, working_days)
+
+
+def cache_frame(_data):
+	df, working_days, _ = csvio.read_df(io.BytesIO(_data))
+	return normalize_hours(df, working_days)
+
+
+def compact_sheet(_data):
+	return csvio.load_sheet(io.BytesIO(_data))
+
+
+REPRESENTATIONS = [("pandas", pandas_frame), ("frame", cache_frame), ("sheet", compact_sheet)]
+
+
+def measure(_build, _sources):
+	"""Returns the bytes held by the built sheets and the peak bytes while building them"""
+	# the calendar and the imports are loaded before measuring
+	_build(_sources[0])
+	gc.collect()
+	tracemalloc.start()
+	kept = [_build(data) for data in _sources]
+	gc.collect()
+	held, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	del kept
+	return held, peak
+
+
+if __name__ == '__main__':
+	arg_parser = argparse.ArgumentParser(description="Compara la memoria de las hojas en pandas y en csvio.Sheet.")
+	arg_parser.add_argument("-p", "--people", type=int, default=300, help="hojas, una por persona")
+	arg_parser.add_argument("-m", "--months", type=int, default=1, help="meses de cada hoja")
+	args = arg_parser.parse_args()
+
+	sources = [make_sheet(months=args.months, projects=10, wps=2, teaching=0.3, prefill=0.2, seed=person)[0]
+			   .encode(csvio.ENCODING) for person in range(args.people)]
+	print(f"{args.people} hojas de {args.months} meses, {sum(len(data) for data in sources) / 1e6:.1f} MB de CSV")
+	print(f"{'formato':>8} {'retenido MB':>12} {'pico MB':>8} {'KB/hoja':>8}")
+	for name, build in REPRESENTATIONS:
+		held, peak = measure(build, sources)
+		print(f"{name:>8} {held / 1e6:>12.2f} {peak / 1e6:>8.2f} {held / 1e3 / args.people:>8.1f}")
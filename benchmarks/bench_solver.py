@@ -0,0 +1,42 @@
+"""Greedy engine against the exact solver on 1, 3 and 12 month sheets.
+
+Run with ``python -m benchmarks.bench_solver``.
+"""
+import io
+import time
+
+from benchmarks.generator import make_sheet
+from main import read_df, solve_month, SolverException
+
+OTHER_ACTIVITIES = {"__teaching__": 1.0, "__other_id__": -1, "__other__": -1, "__lessons__": -1}
+
+
+def run(months, solver, repeat=3):
+	csv, keys = make_sheet(months=months, projects=6, seed=months)
+	df, working_days, num_working_days = read_df(io.StringIO(csv))
+	hours_by_project = {key: (-1 if i % 2 else 20.0 * months) for i, key in enumerate(keys)}
+	best = None
+	for _ in range(repeat):
+		start = time.perf_counter()
+		try:
+			solved = solve_month(df.copy(), working_days, num_working_days, OTHER_ACTIVITIES, dict(hours_by_project),
+								 solver=solver)
+		except SolverException as e:
+			return {"months": months, "solver": solver, "error": str(e)}
+		elapsed = time.perf_counter() - start
+		best = elapsed if best is None else min(best, elapsed)
+	daily = solved[working_days].sum(axis=0)
+	projects = solved.loc[solved['Id Actividad'] == 92, working_days]
+	return {"months": months, "solver": solver, "seconds": best, "days": len(working_days),
+			"max_day": float(daily.max()), "assigned": float(daily.sum()), "max_project_day": float(projects.max().max())}
+
+
+if __name__ == '__main__':
+	print(f"{'meses':>6} {'modo':>7} {'días':>5} {'segundos':>10} {'máx. día':>9} {'asignadas':>10} {'pico proyecto':>14}")
+	for months in [1, 3, 12]:
+		for solver in ["greedy", "lp"]:
+			r = run(months, solver)
+			if "error" in r:
+				print(f"{months:>6} {solver:>7} error: {r['error']}")
+			else:
+				print(f"{months:>6} {solver:>7} {r['days']:>5} {r['seconds']:>10.4f} {r['max_day']:>9.2f} {r['assigned']:>10.1f} {r['max_project_day']:>14.2f}")
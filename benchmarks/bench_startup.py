@@ -0,0 +1,64 @@
+"""Startup cost of the entry points, measured with ``python -X importtime``.
+
+Every module is imported ``--repeat`` times in a new interpreter. The table
+shows the median of the cumulative import time of the module, the wall time
+of the whole process and which of the heavy packages were loaded on the way.
+
+Run with ``python -m benchmarks.bench_startup [-r 5] [-o startup.json] [module ...]``.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ["core", "csvio", "batch", "planner", "main", "index", "wsgi"]
+HEAVY = ["numpy", "pandas", "scipy", "flask", "pretty_html_table", "dateutil"]
+
+
+def parse_importtime(_stderr):
+	"""Returns the cumulative microseconds of every module in -X importtime output, the outermost import of each"""
+	times = {}
+	for line in _stderr.splitlines():
+		if not line.startswith("import time:") or "cumulative" in line:
+			continue
+		_, cumulative, name = line[len("import time:"):].split("|")
+		times[name.strip()] = max(times.get(name.strip(), 0), int(cumulative))
+	return times
+
+
+def measure(_module, repeat=5):
+	"""Returns the median import and process seconds of a module and the heavy packages it loads"""
+	imports, walls, loaded = [], [], []
+	for _ in range(repeat):
+		start = time.perf_counter()
+		process = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {_module}"], cwd=ROOT,
+								 capture_output=True, text=True)
+		walls.append(time.perf_counter() - start)
+		if process.returncode != 0:
+			raise RuntimeError(f"No se pudo importar {_module}:\n{process.stderr[-2000:]}")
+		times = parse_importtime(process.stderr)
+		imports.append(times.get(_module, 0) / 1e6)
+		loaded = [name for name in HEAVY if name in times]
+	return {"module": _module, "import": statistics.median(imports), "process": statistics.median(walls),
+			"loaded": loaded}
+
+
+if __name__ == '__main__':
+	arg_parser = argparse.ArgumentParser(description="Mide el tiempo de arranque de cada punto de entrada.")
+	arg_parser.add_argument("modules", nargs="*", default=MODULES)
+	arg_parser.add_argument("-r", "--repeat", type=int, default=5)
+	arg_parser.add_argument("-o", "--output", help="fichero JSON de resultados")
+	args = arg_parser.parse_args()
+
+	results = [measure(module, repeat=args.repeat) for module in args.modules]
+	print(f"{'módulo':>10} {'import ms':>10} {'proceso ms':>11}  paquetes")
+	for result in results:
+		print(f"{result['module']:>10} {result['import'] * 1000:>10.1f} {result['process'] * 1000:>11.1f}  "
+			  f"{', '.join(result['loaded'])}")
+	if args.output:
+		with open(args.output, 'w', encoding='utf-8') as f:
+			json.dump({"python": sys.version.split()[0], "repeat": args.repeat, "modules": results}, f, indent=2)
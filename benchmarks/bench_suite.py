@@ -0,0 +1,207 @@
+"""Timings of every stage of a solve on synthetic sheets, saved as JSON to compare runs.
+
+The cases vary the months, the project/WP rows, the activity hours already in
+the sheet and how much of the free hours the targets ask for, including sheets
+near their capacity and sheets that can not be solved. The stages are timed
+one by one (``read_df``, ``check_hours``, ``solve_hours``,
+``transform_df_to_str_types``) and through the Flask test client (``/config``,
+``/solve`` until its job ends and ``/preview``).
+
+Run with ``python -m benchmarks.bench_suite [-o bench.json] [--compare old.json]``.
+With ``--compare`` the stages slower than the old run by more than the
+tolerance are listed and the exit status is 1.
+"""
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.generator import make_sheet, make_targets
+from engine import MAX_HOUR_DAY
+from main import SolverException, check_hours, read_df, solve_hours, transform_df_to_str_types
+
+OTHER_ACTIVITIES = {"__teaching__": 1.0, "__other_id__": -1, "__other__": -1, "__lessons__": -1}
+
+# name, months, projects, WPs per project, teaching, other activities, absences, load
+CASES = [
+	("1m-small", 1, 3, 1, 0.3, 0.0, 0.0, 0.5),
+	("1m-near-capacity", 1, 6, 1, 0.3, 0.2, 0.05, 0.98),
+	("1m-infeasible", 1, 6, 1, 0.3, 0.2, 0.05, 1.3),
+	("3m-prefilled", 3, 8, 2, 0.5, 0.3, 0.05, 0.7),
+	("12m-large", 12, 12, 3, 0.3, 0.1, 0.05, 0.8),
+]
+TOLERANCE = 0.25
+
+
+def timed(fn, repeat):
+	"""Runs fn repeat times and returns the median and best seconds and the last result or SolverException"""
+	seconds, result = [], None
+	for _ in range(repeat):
+		start = time.perf_counter()
+		try:
+			result = fn()
+		except SolverException as e:
+			result = e
+		seconds.append(time.perf_counter() - start)
+	return {"median": statistics.median(seconds), "min": min(seconds)}, result
+
+
+def form_of(_hours_by_project, _other_activities, _filename):
+	form = {"filename": _filename}
+	form.update({str(key): str(value) for key, value in _hours_by_project.items()})
+	form.update({str((key, -1)): str(value) for key, value in _other_activities.items()})
+	return form
+
+
+def http_stages(client, csv, hours_by_project, repeat):
+	# every /solve uses its own seed, so the job queue does not hand back a finished job
+	stages = {}
+	data = csv.encode('iso-8859-1')
+	names = iter(range(10 ** 6))
+
+	def upload():
+		client.post('/config', data={'file': (io.BytesIO(data), "bench.csv")}, content_type='multipart/form-data')
+		# uploads are known by the hash of their content
+		return hashlib.sha256(data).hexdigest()
+
+	stages["http_config"], _ = timed(upload, repeat)
+
+	def solve():
+		form = dict(form_of(hours_by_project, OTHER_ACTIVITIES, upload()), seed=str(next(names)))
+		job = client.post('/solve', data=form, headers={'Accept': 'application/json'}).get_json()
+		while job['status'] not in ('done', 'failed'):
+			time.sleep(0.001)
+			job = client.get(f"/jobs/{job['id']}").get_json()
+		return job['status']
+
+	stages["http_solve"], _ = timed(solve, repeat)
+
+	# the first preview of a session solves everything, the next ones only what changed
+	form = form_of(hours_by_project, OTHER_ACTIVITIES, upload())
+	stages["http_preview_first"], _ = timed(
+		lambda: client.post('/preview', data=dict(form, preview_session=f"first{next(names)}")), repeat)
+	form["preview_session"] = "bench"
+	fixed = [key for key, value in hours_by_project.items() if value != -1]
+	steps = iter(range(10 ** 6))
+
+	def preview():
+		# the version of the last answer goes back with the next change, as the page does
+		response = client.post('/preview', data=form)
+		if response.get_json().get("version"):
+			form["preview_version"] = response.get_json()["version"]
+		return response
+
+	def preview_change():
+		# nudge one target, as typing in the form does
+		key = fixed[next(steps) % len(fixed)]
+		form[str(key)] = str(hours_by_project[key] - next(steps) % 2)
+		return preview()
+
+	preview()
+	stages["http_preview"], _ = timed(preview_change, repeat)
+	return stages
+
+
+def run_case(case, repeat, client=None):
+	name, months, projects, wps, teaching, prefill, absences, load = case
+	csv, keys = make_sheet(months=months, projects=projects, teaching=teaching, seed=months, wps=wps, prefill=prefill,
+						   absences=absences)
+	stages = {}
+	stages["read_df"], (df, working_days, num_working_days) = timed(lambda: read_df(io.StringIO(csv)), repeat)
+	# free hours once the activity minimums are in
+	base = check_hours(df.copy(), working_days, num_working_days, dict(OTHER_ACTIVITIES), {})
+	free_hours = MAX_HOUR_DAY * num_working_days - float(base[working_days].sum().sum())
+	hours_by_project = make_targets(keys, free_hours, load=load, seed=months)
+
+	stages["check_hours"], checked = timed(lambda: check_hours(df.copy(), working_days, num_working_days,
+															   dict(OTHER_ACTIVITIES), dict(hours_by_project)), repeat)
+	result = {"name": name, "months": months, "rows": len(df), "days": num_working_days, "load": load}
+	if isinstance(checked, SolverException):
+		result["status"] = "error"
+		result["violations"] = len(checked.violations)
+	else:
+		stages["solve_hours"], solved = timed(lambda: solve_hours(checked.copy(), dict(hours_by_project), working_days,
+																   rng=random.Random(0)), repeat)
+		stages["transform_df_to_str_types"], _ = timed(lambda: transform_df_to_str_types(solved.copy(), working_days), repeat)
+		result["status"] = "error" if isinstance(solved, SolverException) else "ok"
+	if client is not None:
+		stages.update(http_stages(client, csv, hours_by_project, repeat))
+	result["stages"] = stages
+	return result
+
+
+def run(repeat=5, http=True):
+	if not http:
+		cases = [run_case(case, repeat) for case in CASES]
+	else:
+		import index
+		# the app writes uploads/ and results/ under the working directory
+		folder, cwd = tempfile.mkdtemp(prefix='burrocracia-bench-'), os.getcwd()
+		os.makedirs(os.path.join(folder, 'uploads'))
+		os.makedirs(os.path.join(folder, 'results'))
+		os.chdir(folder)
+		try:
+			client = index.app.test_client()
+			with contextlib.redirect_stdout(io.StringIO()):
+				cases = [run_case(case, repeat, client) for case in CASES]
+		finally:
+			os.chdir(cwd)
+			shutil.rmtree(folder, ignore_errors=True)
+	return {"python": platform.python_version(), "numpy": np.__version__, "pandas": pd.__version__,
+			"machine": platform.machine(), "repeat": repeat, "cases": cases}
+
+
+def compare(_old, _new, tolerance=TOLERANCE):
+	"""Returns (case, stage, old, new) for every stage whose median is slower than tolerance times the old one"""
+	old_cases = {case["name"]: case for case in _old["cases"]}
+	slower = []
+	for case in _new["cases"]:
+		old_stages = old_cases.get(case["name"], {}).get("stages", {})
+		for stage, timing in case["stages"].items():
+			if stage in old_stages and timing["median"] > old_stages[stage]["median"] * (1 + tolerance):
+				slower.append((case["name"], stage, old_stages[stage]["median"], timing["median"]))
+	return slower
+
+
+def print_results(_results):
+	print(f"{'caso':>18} {'etapa':>26} {'mediana s':>10} {'mínimo s':>10}")
+	for case in _results["cases"]:
+		for stage, timing in case["stages"].items():
+			print(f"{case['name']:>18} {stage:>26} {timing['median']:>10.4f} {timing['min']:>10.4f}")
+
+
+if __name__ == '__main__':
+	arg_parser = argparse.ArgumentParser(description="Mide cada etapa de la resolución con hojas sintéticas.")
+	arg_parser.add_argument("-o", "--output", default="bench.json", help="fichero JSON de resultados")
+	arg_parser.add_argument("-r", "--repeat", type=int, default=5)
+	arg_parser.add_argument("--compare", help="JSON de una ejecución anterior")
+	arg_parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="margen antes de marcar una etapa como más lenta")
+	arg_parser.add_argument("--no-http", action="store_true", help="no medir las rutas de Flask")
+	args = arg_parser.parse_args()
+
+	output = os.path.abspath(args.output)
+	baseline = None
+	if args.compare:
+		with open(args.compare, encoding='utf-8') as f:
+			baseline = json.load(f)
+	results = run(repeat=args.repeat, http=not args.no_http)
+	with open(output, 'w', encoding='utf-8') as f:
+		json.dump(results, f, indent=2)
+	print_results(results)
+	if baseline is not None:
+		slower = compare(baseline, results, tolerance=args.tolerance)
+		for name, stage, old, new in slower:
+			print(f"Más lento: {name} {stage} {old:.4f}s -> {new:.4f}s")
+		sys.exit(1 if slower else 0)
@@ -0,0 +1,65 @@
+import calendar
+import datetime
+import random
+
+HEADER = ["DNI", "Nombre", "Clave específica", "Proyecto", "Id Actividad", "Actividad", "Working Package"]
+ACTIVITIES = [(97, "Docencia "), (98, "Otros proyectos I+D "), (99, "Ausencias/Vacaciones "),
+			  (100, "Otras actividades "), (108, "Formación participante ")]
+
+
+def month_range(_first_month, _months):
+	"""Returns the first and last date of a run of months starting in _first_month"""
+	year, month = _first_month.year, _first_month.month + _months - 1
+	year, month = year + (month - 1) // 12, (month - 1) % 12 + 1
+	return _first_month.replace(day=1), datetime.date(year, month, calendar.monthrange(year, month)[1])
+
+
+def make_sheet(months=1, projects=3, teaching=0.3, seed=0, first_month=datetime.date(2023, 1, 1), wps=1, prefill=0.0,
+			   absences=0.0):
+	"""Returns the text of a synthetic DEDICA CSV and the project keys in it.
+
+	``teaching`` is the probability of a working day with teaching hours already filled in, ``prefill`` the same
+	for the other activities and ``absences`` the probability of a whole day of absence. With ``wps`` > 1 every
+	project has that many WP rows.
+	"""
+	rnd = random.Random(seed)
+	first_date, last_date = month_range(first_month, months)
+	dates = [first_date + datetime.timedelta(days=i) for i in range((last_date - first_date).days + 1)]
+	lines = [";".join(HEADER + [f"{d.day}/{d.month}/{d.strftime('%y')}" for d in dates])]
+	keys = []
+	for i in range(projects):
+		name = f"PROYECTO{i}"
+		for wp in ([rnd.choice([-1, 1, 2, 3])] if wps == 1 else range(1, wps + 1)):
+			keys.append((name, wp))
+			lines.append(";".join(["00000000", "APELLIDO, NOMBRE", str(20230000 + i), name, "92", "I+D+i ", str(wp)] +
+								  [""] * len(dates)))
+	for code, name in ACTIVITIES:
+		cells = []
+		for d in dates:
+			if code == 97 and d.weekday() < 5 and rnd.random() < teaching:
+				cells.append(rnd.choice(["1", "1,5", "2", "3"]))
+			elif code == 99 and absences and d.weekday() < 5 and rnd.random() < absences:
+				cells.append("7,5")
+			elif code in (98, 100, 108) and prefill and d.weekday() < 5 and rnd.random() < prefill:
+				cells.append(rnd.choice(["0,5", "1"]))
+			else:
+				cells.append("")
+		lines.append(";".join(["00000000", "APELLIDO, NOMBRE", "-1", "Otras Actividades", str(code), name, "-1"] + cells))
+	return "\n".join(lines) + "\n", keys
+
+
+def make_targets(keys, free_hours, load=0.5, unconstrained=0.3, seed=0):
+	"""Returns hours_by_project asking for ``load`` times the free hours of the sheet.
+
+	About ``unconstrained`` of the projects have no minimum (-1); the rest share the hours at random. A load close
+	to 1 is a sheet near its capacity and a load over 1 can not be solved.
+	"""
+	rnd = random.Random(seed)
+	free_keys = [key for key in keys if rnd.random() < unconstrained]
+	fixed = [key for key in keys if key not in free_keys] or list(keys)
+	weights = [rnd.uniform(0.5, 1.5) for _ in fixed]
+	total = free_hours * load
+	targets = {key: -1 for key in keys}
+	for key, weight in zip(fixed, weights):
+		targets[key] = round(total * weight / sum(weights) * 2) / 2
+	return targets
@@ -0,0 +1,141 @@
+"""Throughput of /preview on the dev server (``python index.py``) and on the production one (gunicorn + wsgi.py).
+
+Every server is started on its own port in a temporary folder, a synthetic
+sheet is uploaded and ``--clients`` threads post /preview for ``--seconds``,
+each one with its own preview session and nudging one target per request,
+as typing in the form does.
+
+Run with ``python -m benchmarks.load_test [--server dev|wsgi|both] [-c 8] [-s 10]``.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+
+from benchmarks.bench_suite import OTHER_ACTIVITIES, form_of
+from benchmarks.generator import make_sheet, make_targets
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PORTS = {"dev": 5101, "wsgi": 5102}
+START_TIMEOUT = 60
+
+
+def server_command(_server):
+	if _server == "dev":
+		return [sys.executable, os.path.join(ROOT, "index.py")]
+	return [sys.executable, "-m", "gunicorn", "-c", os.path.join(ROOT, "gunicorn.conf.py"), "--pythonpath", ROOT,
+			"wsgi:app"]
+
+
+def start_server(_server, _folder):
+	"""Starts a server in its own process group and waits until /ready answers"""
+	env = dict(os.environ, PORT=str(PORTS[_server]), HOST="127.0.0.1")
+	process = subprocess.Popen(server_command(_server), cwd=_folder, env=env, stdout=subprocess.DEVNULL,
+							   stderr=subprocess.DEVNULL, start_new_session=True)
+	url = f"http://127.0.0.1:{PORTS[_server]}"
+	deadline = time.monotonic() + START_TIMEOUT
+	while time.monotonic() < deadline:
+		try:
+			with urllib.request.urlopen(f"{url}/ready", timeout=1) as response:
+				if response.status == 200:
+					return process, url
+		except (urllib.error.URLError, ConnectionError):
+			time.sleep(0.2)
+	stop_server(process)
+	raise RuntimeError(f"El servidor {_server} no arrancó en {START_TIMEOUT}s")
+
+
+def stop_server(_process):
+	# the dev server reloader runs the app in a child process, so stop the whole group
+	os.killpg(_process.pid, signal.SIGTERM)
+	try:
+		_process.wait(timeout=30)
+	except subprocess.TimeoutExpired:
+		os.killpg(_process.pid, signal.SIGKILL)
+
+
+def upload(_url, _data):
+	"""Uploads a sheet through /config and returns its id, the hash of its content"""
+	boundary = uuid.uuid4().hex
+	body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"load.csv\"\r\n"
+			f"Content-Type: text/csv\r\n\r\n").encode() + _data + f"\r\n--{boundary}--\r\n".encode()
+	request = urllib.request.Request(f"{_url}/config", data=body,
+									 headers={"Content-Type": f"multipart/form-data; boundary={boundary}"})
+	with urllib.request.urlopen(request) as response:
+		response.read()
+	return hashlib.sha256(_data).hexdigest()
+
+
+def client(_url, _form, _fixed, _seconds, _latencies, _errors):
+	form = dict(_form, preview_session=uuid.uuid4().hex)
+	step = 0
+	deadline = time.monotonic() + _seconds
+	while time.monotonic() < deadline:
+		key, hours = _fixed[step % len(_fixed)]
+		form[str(key)] = str(hours - step % 2)
+		step += 1
+		start = time.perf_counter()
+		try:
+			with urllib.request.urlopen(f"{_url}/preview", data=urllib.parse.urlencode(form).encode()) as response:
+				# the version of the answer goes back with the next change, as the page does
+				form['preview_version'] = json.loads(response.read()).get('version', '')
+			_latencies.append(time.perf_counter() - start)
+		except (urllib.error.URLError, ConnectionError):
+			_errors.append(1)
+
+
+def load_test(_server, clients=8, seconds=10.0):
+	"""Returns the requests per second and latencies of /preview on a server"""
+	folder = tempfile.mkdtemp(prefix="burrocracia-load-")
+	csv, keys = make_sheet(months=1, projects=8, wps=2, teaching=0.3, seed=1)
+	# about 130 free hours in the month once the teaching minimum is in, so every preview can be solved
+	hours_by_project = make_targets(keys, free_hours=100.0, load=0.8, seed=1)
+	process = None
+	try:
+		process, url = start_server(_server, folder)
+		form = form_of(hours_by_project, OTHER_ACTIVITIES, upload(url, csv.encode("iso-8859-1")))
+		fixed = [(key, value) for key, value in hours_by_project.items() if value != -1]
+		latencies, errors = [], []
+		threads = [threading.Thread(target=client, args=(url, form, fixed, seconds, latencies, errors))
+				   for _ in range(clients)]
+		start = time.perf_counter()
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		elapsed = time.perf_counter() - start
+	finally:
+		if process is not None:
+			stop_server(process)
+		shutil.rmtree(folder, ignore_errors=True)
+	latencies.sort()
+	return {"server": _server, "requests": len(latencies), "errors": len(errors),
+			"rps": len(latencies) / elapsed, "p50": statistics.median(latencies) if latencies else None,
+			"p95": latencies[int(0.95 * (len(latencies) - 1))] if latencies else None}
+
+
+if __name__ == '__main__':
+	arg_parser = argparse.ArgumentParser(description="Compara el rendimiento de /preview en el servidor de desarrollo y en gunicorn.")
+	arg_parser.add_argument("--server", choices=["dev", "wsgi", "both"], default="both")
+	arg_parser.add_argument("-c", "--clients", type=int, default=8, help="clientes concurrentes")
+	arg_parser.add_argument("-s", "--seconds", type=float, default=10.0, help="duración de cada prueba")
+	args = arg_parser.parse_args()
+
+	servers = ["dev", "wsgi"] if args.server == "both" else [args.server]
+	print(f"{'servidor':>8} {'peticiones':>10} {'errores':>8} {'pet/s':>8} {'p50 ms':>8} {'p95 ms':>8}")
+	for server in servers:
+		result = load_test(server, clients=args.clients, seconds=args.seconds)
+		print(f"{result['server']:>8} {result['requests']:>10} {result['errors']:>8} {result['rps']:>8.1f} "
+			  f"{(result['p50'] or 0) * 1000:>8.1f} {(result['p95'] or 0) * 1000:>8.1f}")
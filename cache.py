@@ -0,0 +1,99 @@
+import collections
+import hashlib
+import io
+import os
+import threading
+import time
+
+import pandas as pd
+
+import csvio
+from main import get_weeks, normalize_hours
+
+UPLOAD_CACHE_MB = 256
+UPLOAD_CACHE_TTL = 3600
+
+
+class ParsedUpload:
+	"""A parsed upload: numeric frame, working days and the ISO week of every working day"""
+
+	def __init__(self, df, working_days, weeks, digest=None):
+		self.df = df
+		self.digest = digest
+		self.working_days = working_days
+		self.num_working_days = len(working_days)
+		self.weeks = weeks
+		self.size = int(df.memory_usage(deep=True).sum())
+		self.created = time.monotonic()
+
+	def frame(self):
+		"""Returns a copy of the frame that can be modified without touching the cache.
+
+		With pandas copy-on-write enabled the copy is a lazy view and the data is
+		only copied by the columns that are written.
+		"""
+		return self.df.copy(deep=not pd.get_option('mode.copy_on_write'))
+
+
+class UploadCache:
+	"""Process-wide LRU cache of parsed uploads keyed by filename and content hash.
+
+	Entries expire after ``ttl`` seconds and the least recently used ones are
+	evicted when the frames use more than ``max_bytes``.
+	"""
+
+	def __init__(self, max_bytes=UPLOAD_CACHE_MB * 1024 * 1024, ttl=UPLOAD_CACHE_TTL):
+		self.max_bytes = max_bytes
+		self.ttl = ttl
+		self.size = 0
+		self.hits = 0
+		self.misses = 0
+		self._entries = collections.OrderedDict()
+		self._lock = threading.Lock()
+
+	def load(self, path):
+		"""Returns the ParsedUpload of a file, parsing it only when its content is not cached"""
+		with open(path, 'rb') as f:
+			data = f.read()
+		return self.load_bytes(os.path.basename(path), data)
+
+	def load_bytes(self, name, data):
+		"""Returns the ParsedUpload of the content of a file"""
+		key = (name, hashlib.sha256(data).hexdigest())
+		with self._lock:
+			self._expire()
+			entry = self._entries.get(key)
+			if entry is not None:
+				self._entries.move_to_end(key)
+				self.hits += 1
+				return entry
+			self.misses += 1
+
+		df, working_days, _ = csvio.read_df(io.BytesIO(data))
+		entry = ParsedUpload(normalize_hours(df, working_days), working_days, get_weeks(working_days), digest=key[1])
+
+		with self._lock:
+			if key not in self._entries:
+				self._entries[key] = entry
+				self.size += entry.size
+				self._evict()
+		return entry
+
+	def clear(self):
+		with self._lock:
+			self._entries.clear()
+			self.size = 0
+
+	def _expire(self):
+		now = time.monotonic()
+		for key in [key for key, entry in self._entries.items() if now - entry.created > self.ttl]:
+			self.size -= self._entries.pop(key).size
+
+	def _evict(self):
+		while self.size > self.max_bytes and len(self._entries) > 1:
+			_, entry = self._entries.popitem(last=False)
+			self.size -= entry.size
+
+
+uploads = UploadCache(max_bytes=float(os.environ.get('UPLOAD_CACHE_MB', UPLOAD_CACHE_MB)) * 1024 * 1024,
+					  ttl=float(os.environ.get('UPLOAD_CACHE_TTL', UPLOAD_CACHE_TTL)))
@@ -0,0 +1,130 @@
+"""The solver on plain arrays: working days, checks and allocation, without pandas.
+
+A sheet is a rows x days hours matrix with the project key and activity id of
+every row and the d/m/yy label of every day column. main.py wraps these
+functions for pandas frames; batch.py and planner.py use them through
+csvio.Sheet, so the command line tools start without loading pandas.
+"""
+import logging
+import os
+import random
+
+import numpy as np
+
+import metrics
+from engine import ACTIVITY_CODES, MAX_HOUR_DAY, MAX_HOUR_WEEK, SolverException, row_targets, solve_matrix
+from lp import LP_STEP, LP_TIME_LIMIT, LPFallback, solve_lp
+from validation import RowIndex, apply_minimums, find_violations
+from workcalendar import ABSENCE_CODE, absent_columns, get_calendar, iso_week, label_date
+
+SOLVERS = ["greedy", "lp"]
+
+logger = logging.getLogger(__name__)
+
+
+def get_working_days(_first_date, _last_date, dni=None):
+	"""Returns a list of the working days in a range of dates, without the holidays and absences of the calendar"""
+	return list(get_calendar().index(_first_date, _last_date, dni).days)
+
+
+def get_weeks(_working_days):
+	"""Returns the ISO (year, week) of every working day"""
+	return [iso_week(day) for day in _working_days]
+
+
+def sheet_working_days(_labels, _hours, _activity_ids, dni=None):
+	"""Returns the working days of the day columns of a sheet: the calendar of its person without the days filled by absences"""
+	_working_days = get_working_days(label_date(_labels[0]), label_date(_labels[-1]), dni=dni)
+	column = {label: i for i, label in enumerate(_labels)}
+	absent = absent_columns(_hours[:, [column[day] for day in _working_days]], _activity_ids,
+							float(os.environ.get('DAILY_MAX', MAX_HOUR_DAY)))
+	return [day for day, full in zip(_working_days, absent) if not full]
+
+
+def project_keys(_row_keys, _activity_ids):
+	"""Returns the keys of the rows that are not activities, in order and once, as generate_questions asks for them"""
+	activities = set(ACTIVITY_CODES.values()) | {ABSENCE_CODE}
+	return list(dict.fromkeys(key for key, code in zip(_row_keys, _activity_ids) if code not in activities))
+
+
+def check_matrix(_hours, _activity_ids, _working_days, _num_working_days, _other_activities, _hours_by_project,
+				 weeks=None, daily_max=None, weekly_max=None, other_hours=None):
+	"""Raises the activity rows to their daily minimums and checks the monthly, daily and weekly limits.
+
+	Returns a new matrix with the minimums. ``other_hours`` are the hours of
+	the day columns that are not working days, counted in the monthly message.
+	All the violations are reported together in the SolverException.
+	"""
+	# allow overrides for daily/weekly caps via env vars
+	daily_cap = float(os.environ.get('DAILY_MAX', MAX_HOUR_DAY)) if daily_max is None else daily_max
+	weekly_cap = float(os.environ.get('WEEKLY_MAX', MAX_HOUR_WEEK)) if weekly_max is None else weekly_max
+
+	hours = np.array(_hours, dtype=float)
+	rows = RowIndex(_activity_ids)
+
+	# allocate the activity minimums (teaching first etc.) without exceeding the free hours of each day
+	if any(_other_activities.get(key, -1) != -1 for key in ACTIVITY_CODES):
+		hours = apply_minimums(hours, rows, _other_activities, daily_max=daily_cap)
+
+	requested = sum([x for x in _hours_by_project.values() if x != -1])
+	activity_totals = rows.totals(hours if other_hours is None else np.hstack([hours, other_hours]))
+	violations = find_violations(hours, _working_days, get_weeks(_working_days) if weeks is None else weeks,
+								 _num_working_days, requested, daily_max=daily_cap, weekly_max=weekly_cap,
+								 activity_totals=activity_totals)
+	if violations:
+		raise SolverException("\n".join(v.message.rstrip("\n") for v in violations), violations)
+	return hours
+
+
+def assign_projects(_hours, _row_keys, _hours_by_project, daily_max=MAX_HOUR_DAY, rng=random, fill="random",
+					weights=None, slots=None):
+	"""Assigns the project hours with the greedy engine, see engine.solve_matrix"""
+	hours = solve_matrix(_hours, _row_keys, _hours_by_project, daily_max=daily_max, rng=rng, fill=fill, weights=weights,
+						 slots=slots)
+	metrics.count("solver_iterations", sum(t is not None for t in row_targets(_row_keys, _hours_by_project)),
+				  solver="greedy")
+	return hours
+
+
+def solve_sheet_matrix(_hours, _row_keys, _activity_ids, _working_days, _num_working_days, _other_activities,
+					   _hours_by_project, daily_max=MAX_HOUR_DAY, solver="greedy", weeks=None, rng=random,
+					   fill="random", weights=None, weekly_max=None, other_hours=None, slots=None, info=None):
+	"""Checks and solves the working days of a sheet with the greedy engine or the exact solver (``solver="lp"``).
+
+	Returns the solved hours of the working days. The exact solver falls back
+	to the greedy engine when it hits its time limit. The greedy engine fills
+	the projects without a minimum with the ``fill`` strategy (see
+	engine.FILL_STRATEGIES) and ``rng``. Without ``weekly_max`` the weekly cap
+	comes from WEEKLY_MAX. With ``slots`` (an engine.SlotRules) the hours go in
+	whole slots and blocks; the exact solver only knows the slot size, so it is
+	skipped when the rules have block limits. Both solvers get the activity
+	minimums of check_matrix. ``info``, a dict, gets the solver that gave the
+	hours in ``solver_used``.
+	"""
+	if solver not in SOLVERS:
+		raise SolverException(f"Modo de resolución desconocido: {solver}")
+	metrics.count("solve_rows", len(_row_keys))
+	metrics.count("solve_days", len(_working_days))
+	weeks = get_weeks(_working_days) if weeks is None else weeks
+	info = {} if info is None else info
+	with metrics.stage("check_hours"):
+		hours = check_matrix(_hours, _activity_ids, _working_days, _num_working_days, _other_activities,
+							 _hours_by_project, weeks=weeks, daily_max=daily_max, weekly_max=weekly_max,
+							 other_hours=other_hours)
+	if solver == "lp" and slots is not None and slots.blocks():
+		logger.warning("Exact solver skipped, it has no block limits")
+	elif solver == "lp":
+		weekly_cap = float(os.environ.get('WEEKLY_MAX', MAX_HOUR_WEEK)) if weekly_max is None else weekly_max
+		time_limit = float(os.environ.get('LP_TIME_LIMIT', LP_TIME_LIMIT))
+		try:
+			with metrics.stage("solve_lp"):
+				solved = solve_lp(hours, _row_keys, weeks, _hours_by_project, daily_max=daily_max, weekly_max=weekly_cap,
+								  step=LP_STEP if slots is None else slots.slot, time_limit=time_limit)
+			info['solver_used'] = "lp"
+			return solved
+		except LPFallback as e:
+			logger.warning("Exact solver fallback to greedy: %s", e)
+	info['solver_used'] = "greedy"
+	with metrics.stage("solve_hours"):
+		return assign_projects(hours, _row_keys, _hours_by_project, daily_max=daily_max, rng=rng, fill=fill,
+							   weights=weights, slots=slots)
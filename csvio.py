@@ -0,0 +1,279 @@
+"""Streaming reader and writer for the DEDICA CSV layout.
+
+The files are ``;`` separated, ISO-8859-1 encoded, with seven columns of row
+data followed by one column per day and comma decimals. The day cells are
+converted to a matrix in chunks of rows while the file is read, so large
+exports are parsed in one pass without building an object frame. The row
+data is kept once per distinct value and the hours as integer hundredths of
+an hour when that is exact, see Sheet.
+"""
+import copy
+import csv
+import io
+import sys
+
+import numpy as np
+
+from core import get_weeks, sheet_working_days
+from workcalendar import label_date
+
+ENCODING = 'iso-8859-1'
+META_COLUMNS = 7
+CHUNK_ROWS = 4096
+INT_COLUMNS = ["Id Actividad", "Working Package"]
+# hours are packed as int16 hundredths of an hour, up to 327.67h a cell
+HOUR_SCALE = 100
+PACKED_DTYPE = np.int16
+
+
+def day_label(_header):
+	"""Returns a date header as d/m/yy, the format of the working days"""
+	parts = _header.strip().split('/')
+	if len(parts) == 3 and all(p.isdigit() for p in parts):
+		day, month, year = (int(p) for p in parts)
+		year = year + 2000 if year < 100 else year
+	else:
+		import dateutil.parser as parser
+
+		date = parser.parse(_header, dayfirst=True)
+		day, month, year = date.day, date.month, date.year
+	return sys.intern(f"{day}/{month}/{year % 100:02d}")
+
+
+def parse_hours(_cells, _num_days):
+	"""Converts a flat list of day cells (comma decimals, empty for 0) to a float matrix of _num_days columns"""
+	values = ';'.join(_cells).replace(',', '.').split(';') if _cells else []
+	try:
+		hours = np.array([float(v) if v else 0.0 for v in values], dtype=float)
+	except ValueError:
+		# cells with only blanks
+		hours = np.array([float(v) if v.strip() else 0.0 for v in values], dtype=float)
+	return hours.reshape(-1, _num_days)
+
+
+def pack_hours(_hours):
+	"""Returns the hours as integer hundredths of an hour when that keeps every value exact, as they are otherwise"""
+	scaled = np.rint(_hours * HOUR_SCALE)
+	if scaled.size and (np.abs(scaled).max() > np.iinfo(PACKED_DTYPE).max or
+						not np.array_equal(scaled / HOUR_SCALE, _hours)):
+		return _hours
+	return scaled.astype(PACKED_DTYPE)
+
+
+def unpack_hours(_hours):
+	"""Returns a float copy of packed or float hours, with the same values that were packed"""
+	if _hours.dtype == PACKED_DTYPE:
+		return _hours / HOUR_SCALE
+	return np.array(_hours, dtype=float)
+
+
+def format_hours(_hours):
+	"""Formats a float matrix as rows of day cells: comma decimals and empty cells for 0.
+
+	Each distinct value is formatted once, so the cost is in numpy and not per cell.
+	"""
+	values, inverse = np.unique(_hours, return_inverse=True)
+	labels = np.array([str(v).replace('.', ',') if v != 0 else '' for v in values], dtype=object)
+	return labels[inverse].reshape(_hours.shape)
+
+
+def quote(_field):
+	"""Quotes a field like csv.QUOTE_MINIMAL does"""
+	if ';' in _field or '"' in _field or '\n' in _field or '\r' in _field:
+		return '"' + _field.replace('"', '""') + '"'
+	return _field
+
+
+def read_sheet(_file, chunk_rows=CHUNK_ROWS):
+	"""Reads a sheet from a path or file object.
+
+	Returns the header, the row data (first seven columns) as a rows x 7 matrix
+	of codes into the distinct values of every column, those values, and the
+	hours of every row and day, packed when exact (see pack_hours). Repeated
+	header lines, as in files made by concatenating several exports, are skipped.
+	"""
+	if isinstance(_file, (str, bytes)) or hasattr(_file, '__fspath__'):
+		with open(_file, 'rb') as f:
+			return read_sheet(f, chunk_rows=chunk_rows)
+	if isinstance(_file, io.TextIOBase):
+		return _read_rows(_file, chunk_rows)
+	stream = io.TextIOWrapper(_file, encoding=ENCODING, newline='')
+	try:
+		return _read_rows(stream, chunk_rows)
+	finally:
+		# leave the caller's file open
+		stream.detach()
+
+
+def encode_rows(_rows, _values):
+	"""Returns the codes of rows of row data into the distinct values of every column, adding the new values"""
+	codes = np.empty((len(_rows), META_COLUMNS), dtype=np.int32)
+	for index, (column, cells) in enumerate(zip(_values, zip(*_rows))):
+		for value in dict.fromkeys(cells):
+			column.setdefault(value, len(column))
+		codes[:, index] = np.fromiter(map(column.__getitem__, cells), dtype=np.int32, count=len(cells))
+	return codes
+
+
+def _read_rows(_stream, chunk_rows):
+	reader = csv.reader(_stream, delimiter=';')
+	# the header, days and repeated row data are shared by every sheet of the same period and people
+	header = [sys.intern(x) for x in next(reader)]
+	num_days = len(header) - META_COLUMNS
+	values = [{} for _ in range(META_COLUMNS)]
+	codes, chunks, meta, cells = [], [], [], []
+	for row in reader:
+		if not row or row == header:
+			continue
+		if len(row) < len(header):
+			row = row + [''] * (len(header) - len(row))
+		meta.append(row[:META_COLUMNS])
+		cells.extend(row[META_COLUMNS:len(header)])
+		if len(cells) >= chunk_rows * num_days:
+			codes.append(encode_rows(meta, values))
+			chunks.append(pack_hours(parse_hours(cells, num_days)))
+			meta, cells = [], []
+	if cells or not chunks:
+		codes.append(encode_rows(meta, values))
+		chunks.append(pack_hours(parse_hours(cells, num_days)))
+	if len(chunks) == 1:
+		hours = chunks[0]
+	elif all(chunk.dtype == PACKED_DTYPE for chunk in chunks):
+		hours = np.concatenate(chunks)
+	else:
+		hours = np.concatenate([unpack_hours(chunk) for chunk in chunks])
+	return (header, np.concatenate(codes),
+			[[sys.intern(value) for value in column] for column in values], hours)
+
+
+def write_sheet(_file, _header, _meta, _hours):
+	"""Writes a sheet in the DEDICA layout to a path or binary file object"""
+	if isinstance(_file, (str, bytes)) or hasattr(_file, '__fspath__'):
+		with open(_file, 'wb') as f:
+			return write_sheet(f, _header, _meta, _hours)
+	stream = io.TextIOWrapper(_file, encoding=ENCODING, newline='')
+	stream.write(';'.join(quote(x) for x in _header) + '\n')
+	for start in range(0, len(_meta), CHUNK_ROWS):
+		cells = format_hours(_hours[start:start + CHUNK_ROWS])
+		stream.write(''.join(';'.join([quote(x) for x in meta] + row.tolist()) + '\n'
+							 for meta, row in zip(_meta[start:start + CHUNK_ROWS], cells)))
+	stream.flush()
+	stream.detach()
+
+
+def parse_int(_text):
+	"""Returns the integer of a cell, -1 if it is empty or not a number, as read_df converts the id columns"""
+	try:
+		return int(float(_text))
+	except ValueError:
+		return -1
+
+
+class Sheet:
+	"""A sheet on plain arrays: the header, the row data and the hours of every row and day column.
+
+	The row data is a matrix of codes into the distinct values of each of its
+	seven columns, which repeat from row to row (DNI, name, project, activity),
+	and the hours are packed as integer hundredths of an hour when that is
+	exact. Knows the project key and activity id of every row and which day
+	columns are working days, so the solver of core.py can run without pandas.
+
+	A sheet is not changed in place: with_working_hours returns a new one that
+	shares everything but the hours.
+	"""
+
+	def __init__(self, header, codes, values, hours):
+		self.header = header
+		self.codes = codes
+		self.values = values
+		self.packed = hours
+		self.labels = [day_label(x) for x in header[META_COLUMNS:]]
+		self.row_keys = list(zip(self.column(3).tolist(), self.int_column(6).tolist()))
+		self.activity_ids = self.int_column(4)
+		self.working_days = sheet_working_days(self.labels, self.hours, self.activity_ids,
+											   dni=values[0][codes[0, 0]] if len(codes) else None)
+		self.num_working_days = len(self.working_days)
+		self.weeks = get_weeks(self.working_days)
+		column = {label: i for i, label in enumerate(self.labels)}
+		self.columns = [column[day] for day in self.working_days]
+
+	@property
+	def hours(self):
+		"""A float copy of the hours of every row and day column"""
+		return unpack_hours(self.packed)
+
+	@property
+	def meta(self):
+		"""The row data as lists of text, as in the file"""
+		return np.column_stack([self.column(i) for i in range(META_COLUMNS)]).tolist() if len(self.codes) else []
+
+	@property
+	def nbytes(self):
+		"""Bytes used by the row data and hours"""
+		return (self.codes.nbytes + self.packed.nbytes +
+				sum(sys.getsizeof(value) for column in self.values for value in column))
+
+	def column(self, _index):
+		"""Returns the text of a row data column for every row"""
+		return np.array(self.values[_index], dtype=object)[self.codes[:, _index]]
+
+	def int_column(self, _index):
+		"""Returns a row data column as integers, see parse_int, converting every distinct value once"""
+		return np.array([parse_int(value) for value in self.values[_index]], dtype=int)[self.codes[:, _index]]
+
+	def working_hours(self):
+		"""Returns a copy of the hours of the working days"""
+		return unpack_hours(self.packed[:, self.columns])
+
+	def other_hours(self):
+		"""Returns the hours of the day columns that are not working days"""
+		return unpack_hours(np.delete(self.packed, self.columns, axis=1))
+
+	def with_working_hours(self, _working_hours):
+		"""Returns a copy of the sheet with the hours of its working days replaced, sharing its row data"""
+		hours = self.hours
+		hours[:, self.columns] = _working_hours
+		sheet = copy.copy(self)
+		sheet.packed = pack_hours(hours)
+		return sheet
+
+	def write(self, _file, _working_hours=None):
+		"""Writes the sheet in the DEDICA layout, with the hours of its working days replaced if given"""
+		hours = self.hours
+		if _working_hours is not None:
+			hours[:, self.columns] = _working_hours
+		write_sheet(_file, self.header, self.meta, hours)
+
+
+def load_sheet(_file):
+	return Sheet(*read_sheet(_file))
+
+
+def read_df(_file):
+	"""Same as main.read_df, with the day columns already converted to floats"""
+	import pandas as pd
+
+	header, codes, values, hours = read_sheet(_file)
+	hours = unpack_hours(hours)
+	days = [day_label(x) for x in header[META_COLUMNS:]]
+	df = pd.DataFrame({index: np.array(column, dtype=object)[codes[:, index]] for index, column in enumerate(values)})
+	df.columns = header[:META_COLUMNS]
+	for column in df.columns:
+		# numeric columns, as pandas.read_csv would infer them
+		if column not in INT_COLUMNS and (df.empty or not str(df[column].iloc[0]).lstrip('-').isdigit()):
+			continue
+		converted = pd.to_numeric(df[column], errors='coerce')
+		if column in INT_COLUMNS or not converted.isna().any():
+			df[column] = converted.fillna(-1).astype(int) if column in INT_COLUMNS else converted
+	df = pd.concat([df, pd.DataFrame(hours, columns=days)], axis=1)
+	_working_days = sheet_working_days(days, hours, df['Id Actividad'].to_numpy(),
+									   dni=values[0][codes[0, 0]] if len(codes) else None)
+	return df, _working_days, len(_working_days)
+
+
+def write_df(_df, _file):
+	"""Writes a solved frame in the DEDICA layout, formatting every day column at once"""
+	columns = list(_df.columns)
+	meta = _df[columns[:META_COLUMNS]].fillna('').astype(str).values.tolist()
+	hours = _df[columns[META_COLUMNS:]].to_numpy(dtype=float, na_value=0.0)
+	write_sheet(_file, columns, meta, hours)
@@ -0,0 +1,278 @@
+import os
+import random
+
+import numpy as np
+
+MAX_HOUR_DAY = 7.5
+MAX_HOUR_WEEK = 37.5
+EPSILON = 1e-6
+
+# activity ids of the rows that take the per-day minimums
+ACTIVITY_CODES = {"__teaching__": 97, "__other_id__": 98, "__other__": 100, "__lessons__": 108}
+
+
+class SolverException(Exception):
+	"""An error of the sheet or of the requested hours, with every violation found, if any"""
+
+	def __init__(self, message, violations=None):
+		super().__init__(message)
+		self.violations = violations or []
+
+
+def remaining_capacity(_hours, daily_max=MAX_HOUR_DAY):
+	"""Returns the free hours of every day (column) of an hours matrix"""
+	return np.clip(daily_max - _hours.sum(axis=0), 0.0, None)
+
+
+def spread_hours(_capacity, _target, step=1.0):
+	"""Spreads the target hours over the days with free capacity.
+
+	Days are visited in order in passes of at most ``step`` hours per day, so
+	after ``k`` full passes a day holds ``min(k * step, capacity)``. The number
+	of full passes is found at once and only the last one is cut in day order.
+	"""
+	_capacity = np.asarray(_capacity, dtype=float)
+	allocation = np.zeros_like(_capacity)
+	if _target <= 0 or _capacity.size == 0:
+		return allocation
+	max_passes = int(np.ceil(_capacity.max() / step)) if _capacity.max() > 0 else 0
+	passes = np.arange(max_passes + 1) * step
+	totals = np.minimum(passes[:, None], _capacity[None, :]).sum(axis=1)
+	if _target > totals[-1] + EPSILON:
+		raise SolverException(f"Solo quedan {round(float(totals[-1]), 2)}h libres y se han pedido {_target}h.")
+	full = min(int(np.searchsorted(totals, _target, side='right')) - 1, max_passes)
+	allocation = np.minimum(passes[full], _capacity)
+	if full < max_passes:
+		gain = np.minimum(passes[full + 1], _capacity) - allocation
+		before = np.cumsum(gain) - gain
+		allocation += np.clip(_target - totals[full] - before, 0.0, gain)
+	return allocation
+
+
+def allocate_row(_capacity, _key, _target):
+	"""Spreads the target hours of a project row, reporting the project when they do not fit"""
+	try:
+		return spread_hours(_capacity, _target)
+	except SolverException as e:
+		raise SolverException(f"No caben las horas del proyecto {_key[0]} (WP {_key[1]}). {e}")
+
+
+def row_targets(_row_keys, _hours_by_project):
+	"""Returns the target of every row: only the first row of a project with a minimum gets hours"""
+	targets = [None] * len(_row_keys)
+	seen = set()
+	for index, key in enumerate(_row_keys):
+		if key in seen or key not in _hours_by_project or _hours_by_project[key] == -1:
+			continue
+		seen.add(key)
+		targets[index] = _hours_by_project[key]
+	return targets
+
+
+def pick_random(_num_keys, _num_days, rng=random, weights=None):
+	"""One project per day, chosen with rng.choice (or rng.choices with weights)"""
+	if weights is not None:
+		return np.array(rng.choices(range(_num_keys), weights=weights, k=_num_days), dtype=int)
+	keys = list(range(_num_keys))
+	return np.array([rng.choice(keys) for _ in range(_num_days)], dtype=int)
+
+
+def pick_round_robin(_num_keys, _num_days, rng=random, weights=None):
+	"""The projects take turns, day by day"""
+	return np.arange(_num_days) % _num_keys
+
+
+def share_days(_num_days, weights):
+	"""Splits a number of days in proportion to the weights, by largest remainder"""
+	weights = np.asarray(weights, dtype=float)
+	exact = _num_days * weights / weights.sum()
+	days = np.floor(exact).astype(int)
+	days[np.argsort(days - exact, kind='stable')[:_num_days - days.sum()]] += 1
+	return days
+
+
+def pick_proportional(_num_keys, _num_days, rng=random, weights=None):
+	"""Every project gets a share of the days proportional to its weight, on days shuffled with rng"""
+	picks = np.repeat(np.arange(_num_keys), share_days(_num_days, weights if weights is not None else [1] * _num_keys))
+	order = list(range(_num_days))
+	rng.shuffle(order)
+	return picks[order]
+
+
+def pick_blocks(_num_keys, _num_days, rng=random, weights=None):
+	"""Every project gets one run of consecutive days, proportional to its weight, in an order shuffled with rng"""
+	order = list(range(_num_keys))
+	rng.shuffle(order)
+	days = share_days(_num_days, weights if weights is not None else [1] * _num_keys)
+	return np.repeat(np.array(order, dtype=int), days[order])
+
+
+FILL_STRATEGIES = {"random": pick_random, "round_robin": pick_round_robin, "proportional": pick_proportional,
+				   "blocks": pick_blocks}
+
+
+def fill_unconstrained(_hours, _row_keys, _hours_by_project, daily_max=MAX_HOUR_DAY, rng=random, strategy="random",
+					   weights=None):
+	"""Fills every day with one of the projects without a minimum (-1), chosen by a strategy of FILL_STRATEGIES.
+
+	``weights`` are the weights of the projects for the random, proportional and
+	blocks strategies, by project key. The whole month is assigned at once.
+	"""
+	if strategy not in FILL_STRATEGIES:
+		raise SolverException(f"Estrategia de reparto desconocida: {strategy}")
+	projects_without_restriction = [key for key, value in _hours_by_project.items() if value == -1]
+	if len(projects_without_restriction) == 0:
+		return _hours
+	if weights is not None:
+		weights = [float(weights.get(key, 1.0)) for key in projects_without_restriction]
+	picks = FILL_STRATEGIES[strategy](len(projects_without_restriction), _hours.shape[1], rng=rng, weights=weights)
+	free = daily_max - _hours.sum(axis=0)
+	# rows x projects membership, so the rows of the picked project of every day are found with one product
+	position = {key: i for i, key in enumerate(projects_without_restriction)}
+	members = np.zeros((len(_row_keys), len(projects_without_restriction)), dtype=bool)
+	for index, key in enumerate(_row_keys):
+		if key in position:
+			members[index, position[key]] = True
+	picked = members[:, picks]
+	return np.where(picked, free[None, :], _hours)
+
+
+class SlotRules:
+	"""Granularity and blocks of the slot allocation mode, in hours.
+
+	Projects get hours in multiples of ``slot``, at least ``min_block`` and at
+	most ``max_block`` hours on every day they appear, and a day has at most
+	``max_projects`` projects. The limits are optional.
+	"""
+
+	def __init__(self, slot=0.5, min_block=0.0, max_block=None, max_projects=None):
+		if slot <= 0:
+			raise SolverException("El tamaño de la franja tiene que ser positivo.")
+		self.slot = float(slot)
+		self.min_block = float(min_block or 0.0)
+		self.max_block = None if max_block is None else float(max_block)
+		self.max_projects = None if max_projects is None else int(max_projects)
+		if self.max_block is not None and self.block_slots()[1] < self.block_slots()[0]:
+			raise SolverException(f"El bloque máximo de {self.max_block}h es menor que el mínimo de {self.min_block}h.")
+
+	@classmethod
+	def from_env(cls):
+		"""Returns the rules of SLOT_HOURS, MIN_BLOCK, MAX_BLOCK and MAX_PROJECTS_DAY, None without SLOT_HOURS"""
+		if not os.environ.get('SLOT_HOURS'):
+			return None
+		return cls(float(os.environ['SLOT_HOURS']), float(os.environ.get('MIN_BLOCK') or 0.0),
+				   float(os.environ['MAX_BLOCK']) if os.environ.get('MAX_BLOCK') else None,
+				   int(os.environ['MAX_PROJECTS_DAY']) if os.environ.get('MAX_PROJECTS_DAY') else None)
+
+	def __eq__(self, other):
+		return isinstance(other, SlotRules) and vars(self) == vars(other)
+
+	def __hash__(self):
+		return hash(tuple(vars(self).values()))
+
+	def blocks(self):
+		"""Whether there is any limit besides the slot size"""
+		return self.min_block > 0 or self.max_block is not None or self.max_projects is not None
+
+	def block_slots(self):
+		"""Returns the smallest and largest block in slots, None for no largest"""
+		low = max(1, int(np.ceil(self.min_block / self.slot - EPSILON)))
+		high = None if self.max_block is None else int(np.floor(self.max_block / self.slot + EPSILON))
+		return low, high
+
+
+def allocate_blocks(_free, _open, _need, _key, _rules):
+	"""Spreads the slots of a project over the open days, in blocks within the limits of the rules.
+
+	As few days are used as the minimum block needs, spaced evenly over the
+	period, or the days with the most free slots when those are not enough.
+	"""
+	low, high = _rules.block_slots()
+	days = np.flatnonzero(_open)
+	caps = _free[days] if high is None else np.minimum(_free[days], high)
+	count = min(len(days), _need // low)
+	chosen = np.unique(np.linspace(0, len(days) - 1, count).round().astype(int)) if count else days[:0]
+	if caps[chosen].sum() < _need:
+		chosen = np.sort(np.argsort(-caps, kind='stable')[:count])
+	if count == 0 or caps[chosen].sum() < _need:
+		limits = f" y como mucho {high * _rules.slot}h" if high is not None else ""
+		raise SolverException(f"No caben las {_need * _rules.slot}h del proyecto {_key[0]} (WP {_key[1]}) en bloques "
+							  f"de al menos {low * _rules.slot}h{limits} al día.")
+	allocation = np.zeros_like(_free)
+	allocation[days[chosen]] = spread_hours(caps[chosen], _need).round().astype(int)
+	return allocation
+
+
+def solve_slots(_hours, _row_keys, _hours_by_project, _rules, daily_max=MAX_HOUR_DAY, rng=random, fill="random",
+				weights=None):
+	"""Assigns the project hours in whole slots of the rules, see SlotRules.
+
+	Works on the integer number of free slots of every day. Targets are rounded
+	to slots and only go to days where the row has no hours yet. The projects
+	without a minimum (-1) fill every day in turns, starting with the one
+	chosen by the ``fill`` strategy, while a block fits; the free hours that do
+	not make a block are left empty.
+	"""
+	if fill not in FILL_STRATEGIES:
+		raise SolverException(f"Estrategia de reparto desconocida: {fill}")
+	_hours = np.array(_hours, dtype=float)
+	low, high = _rules.block_slots()
+	num_days = _hours.shape[1]
+	free = np.maximum(0, np.floor((daily_max - _hours.sum(axis=0)) / _rules.slot + EPSILON)).astype(int)
+	project_rows = np.array([key in _hours_by_project for key in _row_keys], dtype=bool)
+	projects = (_hours[project_rows] > 0).sum(axis=0)
+	max_projects = len(_row_keys) if _rules.max_projects is None else _rules.max_projects
+	slots = np.zeros(_hours.shape, dtype=int)
+
+	for index, target in enumerate(row_targets(_row_keys, _hours_by_project)):
+		need = 0 if target is None else int(round(target / _rules.slot))
+		if need <= 0:
+			continue
+		open_days = (free >= low) & (projects < max_projects) & (_hours[index] == 0)
+		allocation = allocate_blocks(free, open_days, need, _row_keys[index], _rules)
+		slots[index] = allocation
+		free -= allocation
+		projects += allocation > 0
+
+	unconstrained = [key for key, value in _hours_by_project.items() if value == -1 and key in _row_keys]
+	if unconstrained:
+		if weights is not None:
+			weights = [float(weights.get(key, 1.0)) for key in unconstrained]
+		picks = FILL_STRATEGIES[fill](len(unconstrained), num_days, rng=rng, weights=weights)
+		first_row = np.array([_row_keys.index(key) for key in unconstrained])
+		day_range = np.arange(num_days)
+		for turn in range(len(unconstrained)):
+			rows = first_row[(picks + turn) % len(unconstrained)]
+			give = free if high is None else np.minimum(free, high)
+			usable = (give >= low) & (projects < max_projects) & (_hours[rows, day_range] == 0) & (slots[rows, day_range] == 0)
+			give = np.where(usable, give, 0)
+			slots[rows, day_range] += give
+			free -= give
+			projects += give > 0
+	return _hours + (slots * _rules.slot).round(6)
+
+
+def solve_matrix(_hours, _row_keys, _hours_by_project, daily_max=MAX_HOUR_DAY, rng=random, fill="random",
+				 weights=None, slots=None):
+	"""Assigns the project hours to a rows x working days matrix.
+
+	Projects with a target are spread in row order over the remaining capacity
+	of each day. Then every day is filled up with one of the projects without a
+	minimum (-1), chosen with ``rng`` and the ``fill`` strategy. With ``slots``
+	(a SlotRules) the hours are assigned in whole slots and blocks instead, see
+	solve_slots.
+	"""
+	if slots is not None:
+		return solve_slots(_hours, _row_keys, _hours_by_project, slots, daily_max=daily_max, rng=rng, fill=fill,
+						   weights=weights)
+	_hours = np.array(_hours, dtype=float)
+	capacity = remaining_capacity(_hours, daily_max)
+	for index, target in enumerate(row_targets(_row_keys, _hours_by_project)):
+		if target is None:
+			continue
+		allocation = allocate_row(capacity, _row_keys[index], target)
+		_hours[index] += allocation
+		capacity -= allocation
+
+	return fill_unconstrained(_hours, _row_keys, _hours_by_project, daily_max=daily_max, rng=rng, strategy=fill,
+							  weights=weights)
@@ -0,0 +1,53 @@
+"""gunicorn settings of the production server, from the environment.
+
+WEB_WORKERS processes (one per core, up to 4) with WEB_THREADS threads (4)
+each listen on HOST:PORT. The solves are CPU bound and hold the GIL, so the
+threads of a worker only overlap the waits of its requests: add workers,
+not threads, to serve more at once, up to about one per core, and keep
+WEB_THREADS at a few. Every worker also runs up to JOB_WORKERS (2) solve
+jobs, and a /batch job BATCH_WORKERS processes, so WEB_WORKERS x JOB_WORKERS
+should not go much over the cores either. The jobs are kept in JOB_DB and
+the uploads and results in their folders, shared by the workers, so any of
+them answers the job pages; a preview answered by another worker sends all
+its rows.
+
+A request may take WEB_TIMEOUT seconds (120); on SIGTERM a worker stops
+answering ready and accepting requests and has WEB_GRACEFUL_TIMEOUT seconds
+(30) to finish the running requests and solve jobs. WEB_MAX_REQUESTS
+restarts a worker after that many requests (0, never).
+"""
+import os
+import signal
+
+bind = f"{os.environ.get('HOST', '0.0.0.0')}:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('WEB_WORKERS', min(os.cpu_count() or 1, 4)))
+threads = int(os.environ.get('WEB_THREADS', 4))
+worker_class = 'gthread'
+timeout = int(os.environ.get('WEB_TIMEOUT', 120))
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('WEB_KEEPALIVE', 5))
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+# load the app, pandas and the caches once in the master, see wsgi.py
+preload_app = True
+accesslog = '-' if os.environ.get('WEB_ACCESS_LOG') else None
+
+
+def post_worker_init(worker):
+	# not ready as soon as SIGTERM arrives, while the running requests and jobs finish
+	handle_exit = worker.handle_exit
+
+	def stop(sig, frame):
+		worker.wsgi.config['READY'] = False
+		handle_exit(sig, frame)
+
+	signal.signal(signal.SIGTERM, stop)
+
+
+def worker_int(worker):
+	worker.wsgi.config['READY'] = False
+
+
+def worker_exit(server, worker):
+	import wsgi
+	wsgi.shutdown(wsgi.app)
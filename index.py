@@ -1,29 +1,74 @@
 # Flask application
-import copy
+import hashlib
+import io
 import os
 import random
-import string
 import re
-
-from flask import Flask, render_template, request, redirect, flash, send_from_directory, jsonify
-from pretty_html_table import build_table
-from werkzeug.utils import secure_filename
-
-from main import read_df, generate_questions, solve_hours, check_hours, transform_df_to_str_types, SolverException
+import time
+import uuid
+import zipfile
+
+import pandas as pd
+from flask import Flask, Response, g, render_template, request, redirect, flash, send_file, jsonify
+
+import batch
+import csvio
+import metrics
+import store
+from api import api
+from cache import uploads
+from engine import SlotRules
+from jobs import DONE, FAILED, JOB_TTL, JOB_WORKERS, JobQueue, JobStore, job_key
+from main import generate_questions, solve_month, SolverException, ACTIVITY_CODES
+from preview import SCENARIO_WORKERS, compare_scenarios, row_labels, scenario_report, sessions as preview_sessions
+
+# frames handed out by the uploads cache are lazy copies
+pd.set_option('mode.copy_on_write', True)
 
 app = Flask(__name__)
+app.register_blueprint(api)
 
 # Set UPLOAD_FOLDER
 app.config['UPLOAD_FOLDER'] = 'uploads'
+# uploads and solved sheets are stored once per content, under their hash
+app.config['UPLOAD_STORE'] = upload_files = store.from_env(app.config['UPLOAD_FOLDER'], suffix='.csv')
+result_files = store.from_env('results', suffix='.csv')
+batch_files = store.from_env('batches', suffix='.zip')
 # Set template folder
 app.config['TEMPLATES_AUTO_RELOAD'] = True
+# set once the app can take requests, see wsgi.py
+app.config['READY'] = False
 
 ALLOWED_EXTENSIONS = {'csv'}
+BATCH_EXTENSIONS = {'zip'}
+# form fields that are not project or activity hours
+FORM_FIELDS = ['filename', 'submit', 'solver', 'preview_session', 'preview_version', 'seed', 'fill']
+# prefix of the fields with the weight of a project in the fill, like "peso_('Project', 3)"
+WEIGHT_PREFIX = 'peso_'
+MAX_SCENARIOS = 32
+
+
+@app.before_request
+def start_timing():
+	g.start = time.perf_counter()
+	metrics.start_trace()
+
 
+@app.after_request
+def record_timing(response):
+	# latency by route and the stages of the request in a Server-Timing header
+	trace = metrics.stop_trace()
+	route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+	metrics.registry.observe("burrocracia_request_seconds", time.perf_counter() - g.start, route=route,
+							 method=request.method)
+	if trace and trace["stages"]:
+		response.headers['Server-Timing'] = metrics.server_timing(trace)
+	return response
 
-def allowed_file(filename):
+
+def allowed_file(filename, extensions=ALLOWED_EXTENSIONS):
 	return '.' in filename and \
-		filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+		filename.rsplit('.', 1)[1].lower() in extensions
 
 
 # View to ask for CSV file
@@ -44,33 +89,94 @@ def config():
 			flash('No selected file')
 			return redirect(request.url)
 		if file and allowed_file(file.filename):
-			filename = secure_filename(file.filename)
-			file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+			# the upload is known by the hash of its content from now on
+			with metrics.stage("upload_save"):
+				filename = upload_files.put(file.read())
 
-			df, working_days, num_working_days = read_df(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+			with metrics.stage("read_df"):
+				upload = uploads.load(upload_files.path(filename))
+			df, working_days = upload.df, upload.working_days
 			questions = generate_questions(df)
 			period = working_days[0] + ' - ' + working_days[-1]
 			max_hours_month = 7.5 * len(working_days)
 
-			# compute existing assigned hours (from CSV)
-			activities_codes = {"__teaching__": 97, "__other_id__": 98, "__other__": 100, "__lessons__": 108}
-			# normalize working_days columns to numeric (replace commas, empty strings)
-			_num_df = df[working_days].replace('', 0).applymap(lambda x: float(str(x).replace(',', '.')) if x not in [None, ''] else 0.0)
-			existing_by_activity = {}
-			for k, code in activities_codes.items():
-				# select rows for activity, convert those columns to numeric similarly
-				sel = df.loc[df['Id Actividad'] == code, working_days]
-				if sel.shape[0] == 0:
-					existing_by_activity[k] = 0.0
-				else:
-					sel_num = sel.replace('', 0).applymap(lambda x: float(str(x).replace(',', '.')) if x not in [None, ''] else 0.0)
-					existing_by_activity[k] = float(sel_num.sum(axis=1).sum())
+			# compute existing assigned hours (from CSV), the cached frame is already numeric
+			with metrics.stage("totals"):
+				_num_df = df[working_days]
+				existing_by_activity = {}
+				for k, code in ACTIVITY_CODES.items():
+					existing_by_activity[k] = float(_num_df[df['Id Actividad'] == code].to_numpy().sum())
+
+				existing_total = float(_num_df.to_numpy().sum())
+
+			with metrics.stage("render"):
+				return render_template('config.html', questions=questions, period=period, filename=filename,
+									   num_working_days=len(working_days), max_hours_month=max_hours_month,
+									   existing_total=existing_total, existing_by_activity=existing_by_activity,
+									   preview_session=uuid.uuid4().hex, seed=random.randrange(2 ** 31))
 
-			existing_total = float(_num_df.sum(axis=1).sum())
 
-			return render_template('config.html', questions=questions, period=period, filename=filename,
-								   num_working_days=len(working_days), max_hours_month=max_hours_month,
-								   existing_total=existing_total, existing_by_activity=existing_by_activity)
+def parse_form(form_data):
+	"""Returns the hours by project and the activity minimums of the config form.
+
+	The keys of the hours are the repr of the (project, wp) tuples.
+	"""
+	hours_by_project = {}
+	other = {}
+	for key, value in form_data.items():
+		if key not in FORM_FIELDS and not key.startswith(WEIGHT_PREFIX):
+			project = parse_key(key)
+			if project[0] in ACTIVITY_CODES:
+				other[project[0]] = float(value) if value != "" else 0
+			elif project[0] == "__empty__":
+				hours_by_project[project] = value
+			else:
+				hours_by_project[project] = float(value) if value != "" else 0
+	return hours_by_project, other
+
+
+def parse_key(key):
+	"""Returns the (project, wp) tuple of the repr of a form field"""
+	# parse key robustly: expect something like "('Project Name, possibly with commas', -1)"
+	s = key.strip()
+	if s.startswith('(') and s.endswith(')'):
+		s = s[1:-1]
+	# try regex to capture last comma + integer (wp)
+	m = re.match(r'^(.*),\s*(-?\d+)\s*$', s)
+	if m:
+		name_part = m.group(1).strip()
+		hours_part = m.group(2).strip()
+	else:
+		parts = s.rsplit(',', 1)
+		name_part = parts[0].strip()
+		hours_part = parts[1].strip() if len(parts) > 1 else '-1'
+	# strip surrounding quotes from name
+	name_part = name_part.strip().strip('"\'')
+	try:
+		wp = int(hours_part)
+	except Exception:
+		wp = int(float(hours_part))
+	return name_part, wp
+
+
+def parse_weights(form_data):
+	"""Returns the weights of the projects of the config form by key, or None when they are all 1.
+
+	Raises ValueError with the message for the user when a weight is not a
+	positive number.
+	"""
+	weights = {}
+	for key, value in form_data.items():
+		if key.startswith(WEIGHT_PREFIX):
+			project = parse_key(key[len(WEIGHT_PREFIX):])
+			try:
+				weight = float(value) if value != "" else 1.0
+			except ValueError:
+				weight = 0.0
+			if not weight > 0:
+				raise ValueError(f"El peso de {project[0]} (WP {project[1]}) tiene que ser un número positivo.")
+			weights[project] = weight
+	return weights if any(weight != 1.0 for weight in weights.values()) else None
 
 
 @app.route('/solve', methods=['GET', 'POST'])
@@ -81,66 +187,90 @@ def solve():
 		# Get filename
 		filename = form_data['filename']
 		# Get hours by project
-		hours_by_project = {}
-		other = {}
-
-		for key, value in form_data.items():
-			if key not in ['filename', 'submit']:
-				# parse key robustly: expect something like "('Project Name, possibly with commas', -1)"
-				s = key.strip()
-				if s.startswith('(') and s.endswith(')'):
-					s = s[1:-1]
-				# try regex to capture last comma + integer (wp)
-				m = re.match(r'^(.*),\s*(-?\d+)\s*$', s)
-				if m:
-					name_part = m.group(1).strip()
-					hours_part = m.group(2).strip()
-				else:
-					parts = s.rsplit(',', 1)
-					name_part = parts[0].strip()
-					hours_part = parts[1].strip() if len(parts) > 1 else '-1'
-				# strip surrounding quotes from name
-				name_part = name_part.strip().strip('"\'')
-				try:
-					wp = int(hours_part)
-				except Exception:
-					wp = int(float(hours_part))
-				project = (name_part, wp)
-				# debug log (prints to server console)
-				print('Parsed form key ->', project, 'value=', value)
-				if project[0] in ["__teaching__", "__other_id__", "__other__", "__lessons__"]:
-					other[project[0]] = float(value) if value != "" else 0
-				elif project[0] == "__empty__":
-					hours_by_project[project] = value
-				else:
-					hours_by_project[project] = float(value) if value != "" else 0
-		# Solve hours
-		df, working_days, num_working_days = read_df(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-
-		# Check hours
+		hours_by_project, other = parse_form(form_data)
+		solver = form_data.get('solver', 'greedy')
+		fill = form_data.get('fill', 'random')
 		try:
-			checked_df = check_hours(df, working_days, num_working_days, other, hours_by_project)
-		except SolverException as e:
-			msgs = str(e).split("\n")
-			return render_template('error.html', error=msgs)
-
-		# use daily cap from env if set
+			seed = parse_seed(form_data.get('seed'))
+		except ValueError:
+			return render_template('error.html', error=['La semilla tiene que ser un número entero.'])
 		try:
-			daily_cap = float(os.environ.get('DAILY_MAX', 7.5))
-		except Exception:
-			daily_cap = 7.5
-		solved_df = solve_hours(checked_df, hours_by_project, working_days, daily_max=daily_cap)
+			weights = parse_weights(form_data)
+		except ValueError as e:
+			return render_template('error.html', error=[str(e)])
+		path = upload_files.path(filename)
+		if path is None:
+			return render_template('error.html', error=['El fichero subido ya no existe. Vuelve a subirlo.']), 404
+		upload = uploads.load(path)
+
+		# solve in the background, the same file and form share the job
+		form_key = {key: value for key, value in form_data.items() if key not in ['submit', 'preview_session']}
+		job = solve_jobs.submit(job_key(upload.digest, form_key), solve_job, path, other, hours_by_project, solver,
+								seed, fill, weights)
+		if request.accept_mimetypes.best == 'application/json':
+			return jsonify(job.to_dict()), 202
+		return redirect(f'/result/{job.id}')
+
+
+def parse_seed(value):
+	"""Returns the seed of a form, None if it is empty"""
+	if value is None or str(value).strip() == '':
+		return None
+	return int(str(value).strip())
+
+
+def solve_job(job, path, other, hours_by_project, solver, seed=None, fill="random", weights=None):
+	"""Solves an upload in the job queue, stores the solved CSV and returns the HTML table of the result.
+
+	Without a seed a new one is drawn; the seed, fill strategy, solver asked,
+	solver used and hash of the stored CSV are kept in job.info so the result
+	can be reproduced. The stages of the solve are kept in job.trace, and
+	profiled if PROFILE_DIR is set.
+	"""
+	seed = random.SystemRandom().randrange(2 ** 31) if seed is None else seed
+	job.info = {'seed': seed, 'fill': fill, 'solver': solver}
+	job.trace = metrics.start_trace()
+	try:
+		with metrics.profiled(f"solve_{job.id}"):
+			table, job.info['result_hash'] = solve_upload(path, other, hours_by_project, solver, random.Random(seed), fill,
+														  weights, job.info)
+		metrics.count("solves", solver=solver, status="ok")
+		return table
+	except Exception:
+		metrics.count("solves", solver=solver, status="error")
+		raise
+	finally:
+		metrics.stop_trace()
 
-		float_df = copy.deepcopy(solved_df)
 
-		solved_df = transform_df_to_str_types(solved_df, working_days)
+def solve_upload(path, other, hours_by_project, solver, rng, fill, weights=None, info=None):
+	# returns the HTML table and the hash of the stored CSV, info gets the solver used
+	with metrics.stage("read_df"):
+		upload = uploads.load(path)
+	df, working_days, num_working_days = upload.frame(), upload.working_days, upload.num_working_days
 
-		# Save to CSV with random name
-		random_id = ''.join(random.choices(string.ascii_uppercase + string.digits, k=4))
-		solved_df.to_csv(os.path.join("results", f'solved_{random_id}.csv'), index=False, sep=";", encoding='iso-8859-1')
+	# use daily cap from env if set
+	try:
+		daily_cap = float(os.environ.get('DAILY_MAX', 7.5))
+	except Exception:
+		daily_cap = 7.5
+	# Check and solve hours
+	solved_df = solve_month(df, working_days, num_working_days, other, hours_by_project, daily_max=daily_cap,
+							solver=solver, weeks=upload.weeks, rng=rng, fill=fill, weights=weights,
+							slots=SlotRules.from_env(), info=info)
+
+	# Save the CSV, once for identical results
+	with metrics.stage("write_csv"):
+		output = io.BytesIO()
+		csvio.write_df(solved_df, output)
+		result_hash = result_files.put(output.getvalue())
+
+	with metrics.stage("build_table"):
+		# the HTML renderer is only loaded by the first result page
+		from pretty_html_table import build_table
 
 		# Delete column from df
-		float_df = float_df.drop(columns=['DNI', "Nombre", "Clave específica", "Id Actividad"])
+		float_df = solved_df.drop(columns=['DNI', "Nombre", "Clave específica", "Id Actividad"])
 		# sum row from 7th row to end
 		# float_df['Horas Totales'] = float_df.iloc[3:].sum()
 		float_df['Horas Totales'] = float_df.loc[:, float_df.columns[3:]].sum(axis=1)
@@ -148,15 +278,61 @@ def solve():
 		columns = ["Proyecto", "Actividad", "Working Package", "Horas Totales"]
 		float_df = float_df[columns + [col for col in float_df.columns if col not in columns]]
 		# Build table
-		html_table = build_table(float_df, 'blue_light')
-
-		return render_template('result.html', df=html_table, random_id=random_id)
+		return build_table(float_df, 'blue_light'), result_hash
+
+
+# the jobs are also kept in JOB_DB, so every worker process of the server can answer for them
+solve_jobs = JobQueue(workers=int(os.environ.get('JOB_WORKERS', JOB_WORKERS)),
+					  ttl=float(os.environ.get('JOB_TTL', JOB_TTL)),
+					  store=JobStore(os.environ.get('JOB_DB', os.path.join(result_files.folder, 'jobs.db'))))
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+	job = solve_jobs.get(job_id)
+	if job is None:
+		return jsonify({'error': 'job not found'}), 404
+	status = job.to_dict()
+	if job.trace is not None:
+		status['timings'] = {name: round(seconds, 6) for name, seconds in job.trace['stages'].items()}
+		status['counters'] = dict(job.trace['counters'])
+	if job.status == DONE:
+		status['result'] = f'/result/{job.id}'
+		status['download'] = f'/download/{job.id}'
+	return jsonify(status)
+
+
+@app.route('/result/<job_id>', methods=['GET'])
+def result(job_id):
+	job = solve_jobs.get(job_id)
+	if job is None:
+		return render_template('error.html', error=['El resultado no existe o ha caducado.']), 404
+	if job.status == FAILED:
+		return render_template('error.html', error=job.error.split("\n"))
+	if job.status != DONE:
+		return render_template('wait.html', job_id=job.id)
+	if job.info.get('kind') == 'batch':
+		return render_template('result.html', df=job.result, random_id=job.id, seed=job.info.get('seed'),
+							   fill=job.info.get('fill'))
+	return render_template('result.html', df=job.result, random_id=job.id, seed=job.info.get('seed'),
+						   fill=job.info.get('fill'),
+						   fallback=job.info.get('solver') != job.info.get('solver_used'))
 
 
 @app.route('/download/<random_id>', methods=['GET'])
 def download(random_id):
-	# return file download
-	return send_from_directory("results", f'solved_{random_id}.csv', as_attachment=True)
+	job = solve_jobs.get(random_id)
+	if job is not None and job.status != DONE:
+		return jsonify(job.to_dict()), 409
+	is_batch = job is not None and job.info.get('kind') == 'batch'
+	files = batch_files if is_batch else result_files
+	path = files.path(job.info.get('result_hash')) if job is not None else None
+	if path is None:
+		return render_template('error.html', error=['El resultado no existe o ha caducado.']), 404
+	# return file download, sent from the stored file
+	if is_batch:
+		return send_file(path, mimetype='application/zip', as_attachment=True, download_name=f'solved_{random_id}.zip')
+	return send_file(path, mimetype='text/csv', as_attachment=True, download_name=f'solved_{random_id}.csv')
 
 
 @app.route('/preview', methods=['POST'])
@@ -168,96 +344,177 @@ def preview():
 		return jsonify({'error': 'filename missing'}), 400
 
 	# parse form into hours_by_project and other
-	hours_by_project = {}
-	other = {}
-	for key, value in form_data.items():
-		if key not in ['filename', 'submit']:
-			s = key.strip()
-			if s.startswith('(') and s.endswith(')'):
-				s = s[1:-1]
-			m = re.match(r'^(.*),\s*(-?\d+)\s*$', s)
-			if m:
-				name_part = m.group(1).strip()
-				hours_part = m.group(2).strip()
-			else:
-				parts = s.rsplit(',', 1)
-				name_part = parts[0].strip()
-				hours_part = parts[1].strip() if len(parts) > 1 else '-1'
-			name_part = name_part.strip().strip('"\'')
-			try:
-				wp = int(hours_part)
-			except Exception:
-				wp = int(float(hours_part))
-			project = (name_part, wp)
-			if project[0] in ["__teaching__", "__other_id__", "__other__", "__lessons__"]:
-				other[project[0]] = float(value) if value != "" else 0
-			elif project[0] == "__empty__":
-				hours_by_project[project] = value
-			else:
-				hours_by_project[project] = float(value) if value != "" else 0
+	hours_by_project, other = parse_form(form_data)
 
 	# read df and compute solved allocation
+	path = upload_files.path(filename)
+	if path is None:
+		return jsonify({'error': 'El fichero subido ya no existe. Vuelve a subirlo.'}), 404
 	try:
-		df, working_days, num_working_days = read_df(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+		upload = uploads.load(path)
 	except Exception as e:
 		return jsonify({'error': f'Error reading CSV: {e}'}), 400
 
 	try:
-		checked_df = check_hours(df.copy(), working_days, num_working_days, other, hours_by_project)
-	except SolverException as e:
+		daily_cap = float(os.environ.get('DAILY_MAX', 7.5))
+	except Exception:
+		daily_cap = 7.5
+	# the session keeps the solver state, so only what changed in the form is solved again
+	try:
+		seed = parse_seed(form_data.get('seed')) or 0
+	except ValueError:
+		return jsonify({'error': 'La semilla tiene que ser un número entero.'}), 400
+	try:
+		weights = parse_weights(form_data)
+	except ValueError as e:
+		return jsonify({'error': str(e)}), 400
+	state = preview_sessions.get(form_data.get('preview_session') or filename, upload, daily_max=daily_cap, seed=seed,
+								 slots=SlotRules.from_env())
+	with state.lock:
+		try:
+			changed, hours = state.solve(other, hours_by_project, solver=form_data.get('solver', 'greedy'),
+										 fill=form_data.get('fill', 'random'), weights=weights,
+										 version=form_data.get('preview_version'))
+		except SolverException as e:
+			return jsonify({'error': str(e), 'violations': [v.to_dict() for v in e.violations]}), 400
+		version = state.version
+
+	totals = hours.sum(axis=1)
+	rows = [dict(state.labels[index], index=index, hours=float(totals[index])) for index in changed]
+	assigned_total = float(totals.sum())
+	max_hours = 7.5 * len(upload.working_days)
+	remaining = max_hours - assigned_total
+
+	return jsonify({'rows': rows, 'num_rows': len(totals), 'version': version, 'assigned_total': assigned_total,
+					'remaining': remaining})
+
+
+@app.route('/scenarios', methods=['POST'])
+def scenarios():
+	"""Compares several target combinations of the config form over one upload, solved together.
+
+	Takes a JSON object with the filename, seed, solver and fill of the form and
+	``scenarios``, a list of ``{"name", "form"}`` where form has the project and
+	activity fields of the config form. Answers the totals of every row in
+	every scenario and their difference with the first one that can be solved.
+	"""
+	payload = request.get_json(silent=True)
+	if not isinstance(payload, dict) or not payload.get('filename') or not isinstance(payload.get('scenarios'), list):
+		return jsonify({'error': 'Hacen falta filename y la lista de scenarios'}), 400
+	max_scenarios = int(os.environ.get('MAX_SCENARIOS', MAX_SCENARIOS))
+	if not 0 < len(payload['scenarios']) <= max_scenarios:
+		return jsonify({'error': f'Se pueden comparar entre 1 y {max_scenarios} escenarios'}), 400
+	try:
+		forms = [(scenario.get('name') or f'Escenario {i + 1}', parse_form(scenario['form']))
+				 for i, scenario in enumerate(payload['scenarios'])]
+		seed = parse_seed(payload.get('seed')) or 0
+	except (AttributeError, KeyError, TypeError, ValueError):
+		return jsonify({'error': 'Cada escenario necesita un form con las horas numéricas del formulario'}), 400
+	try:
+		weights = [parse_weights(scenario['form']) for scenario in payload['scenarios']]
+	except ValueError as e:
 		return jsonify({'error': str(e)}), 400
 
+	path = upload_files.path(payload['filename'])
+	if path is None:
+		return jsonify({'error': 'El fichero subido ya no existe. Vuelve a subirlo.'}), 404
+	try:
+		upload = uploads.load(path)
+	except Exception as e:
+		return jsonify({'error': f'Error reading CSV: {e}'}), 400
 	try:
 		daily_cap = float(os.environ.get('DAILY_MAX', 7.5))
 	except Exception:
 		daily_cap = 7.5
-	solved_df = solve_hours(checked_df.copy(), hours_by_project, working_days, daily_max=daily_cap)
-
-	# build the same summary table as /solve: drop identifying cols, compute 'Horas Totales' per row
-	float_df = copy.deepcopy(solved_df)
-	# drop columns if present
-	for colname in ['DNI', 'Nombre', 'Clave específica', 'Id Actividad']:
-		if colname in float_df.columns:
-			float_df = float_df.drop(columns=[colname])
-	# sum from 4th column onward (index 3)
-	float_df['Horas Totales'] = float_df.loc[:, float_df.columns[3:]].replace('', 0).applymap(lambda x: float(str(x).replace(',', '.')) if x not in [None, ''] else 0.0).sum(axis=1)
-	# reorder columns to put Proyecto, Actividad, Working Package, Horas Totales first if they exist
-	columns = [c for c in ["Proyecto", "Actividad", "Working Package", "Horas Totales"] if c in float_df.columns]
-	float_df = float_df[columns + [col for col in float_df.columns if col not in columns]]
-
-	rows = []
-	# mapping for activity codes (fallback)
-	activity_names = {97: 'Docencia', 98: 'Otros proyectos I+D', 99: 'Ausencias/Vacaciones', 100: 'Otras actividades', 108: 'Formación participante'}
-	for index, row in float_df.iterrows():
-		proj = row.get('Proyecto')
-		actividad = ''
-		idcode = None
-		# prefer explicit 'Actividad' label only for display; but only replace project name
-		# when the row corresponds to a known activity code
-		if 'Actividad' in row.index and str(row.get('Actividad')).strip() != '':
-			actividad = row.get('Actividad')
-
-		# try to read Id Actividad from solved_df to detect special activity rows
-		try:
-			idcode = int(solved_df.loc[index, 'Id Actividad'])
-		except Exception:
-			idcode = None
 
-		# if idcode maps to a known activity, use that as project name and actividad
-		if idcode in activity_names:
-			actividad = activity_names.get(idcode, '')
-			proj = actividad
+	# in the order of the config form, the fill depends on it and JSON clients may sort the keys
+	order = {key: i for i, key in enumerate(dict.fromkeys(zip(upload.df['Proyecto'], upload.df['Working Package'])))}
+	results = compare_scenarios(upload, [(other, dict(sorted(hours_by_project.items(),
+															  key=lambda item: order.get(item[0], len(order)))),
+										  scenario_weights)
+										 for (_, (hours_by_project, other)), scenario_weights in zip(forms, weights)],
+								seed=seed, daily_max=daily_cap, solver=payload.get('solver', 'greedy'),
+								fill=payload.get('fill', 'random'),
+								workers=int(os.environ.get('SCENARIO_WORKERS', SCENARIO_WORKERS)), slots=SlotRules.from_env())
+	labels = row_labels(upload.df)
+	return jsonify({'rows': labels, 'scenarios': scenario_report(labels, [name for name, _ in forms], results,
+																 daily_max=daily_cap,
+																 num_working_days=upload.num_working_days)})
+
+
+@app.route('/health', methods=['GET'])
+def health():
+	return jsonify({'status': 'ok'})
+
+
+@app.route('/ready', methods=['GET'])
+def ready():
+	# preloaded, not shutting down and with somewhere to store the uploads and results
+	folders = [upload_files.folder, result_files.folder, batch_files.folder]
+	if app.config['READY'] and all(os.access(folder, os.W_OK) for folder in folders):
+		return jsonify({'status': 'ready'})
+	return jsonify({'status': 'not ready'}), 503
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+	return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/batch', methods=['GET', 'POST'])
+def solve_batch():
+	if request.method == 'GET':
+		return render_template('batch.html')
+	file = request.files.get('file')
+	if file is None or not allowed_file(file.filename, BATCH_EXTENSIONS):
+		return render_template('error.html', error=['Adjunta un archivo ZIP con los CSV.'])
+	data, manifest_data = file.read(), b''
+	try:
+		sources, targets, weights = batch.load_zip(io.BytesIO(data))
+		manifest = request.files.get('manifest')
+		if manifest is not None and manifest.filename != '':
+			manifest_data = manifest.read()
+			targets, weights = batch.read_manifest(io.StringIO(manifest_data.decode('utf-8')))
+	except (SolverException, ValueError, zipfile.BadZipFile) as e:
+		return render_template('error.html', error=[f'No se puede leer el ZIP o el manifiesto: {e}'])
+	if not sources:
+		return render_template('error.html', error=['El ZIP no contiene ningún CSV.'])
+
+	try:
+		seed = parse_seed(request.form.get('seed'))
+	except ValueError:
+		return render_template('error.html', error=['La semilla tiene que ser un número entero.'])
 
-		wp = int(row.get('Working Package')) if 'Working Package' in row.index else -1
-		hours_total = float(row['Horas Totales']) if 'Horas Totales' in row.index else 0.0
+	# solve in the background, the same ZIP, manifest and form share the job
+	solver = request.form.get('solver', 'greedy')
+	form_key = {'manifest': hashlib.sha256(manifest_data).hexdigest(), 'solver': solver, 'seed': seed, 'kind': 'batch'}
+	job = solve_jobs.submit(job_key(hashlib.sha256(data).hexdigest(), form_key), batch_job, sources, targets, weights,
+							solver, seed)
+	if request.accept_mimetypes.best == 'application/json':
+		return jsonify(job.to_dict()), 202
+	return redirect(f'/result/{job.id}')
 
-		rows.append({'project': proj, 'actividad': actividad, 'wp': wp, 'hours': hours_total})
 
-	assigned_total = float(float_df['Horas Totales'].sum()) if 'Horas Totales' in float_df.columns else 0.0
-	max_hours = 7.5 * len(working_days)
-	remaining = max_hours - assigned_total
+def batch_job(job, sources, targets, weights, solver, seed=None):
+	"""Solves the sheets of a batch in the job queue, stores the ZIP of the results and returns the HTML summary.
+
+	Without a seed a new one is drawn for the batch, kept in job.info and in the summary.
+	"""
+	seed = batch.new_seed() if seed is None else seed
+	job.info = {'kind': 'batch', 'solver': solver, 'seed': seed, 'fill': 'random', 'sheets': len(sources)}
+	try:
+		daily_cap = float(os.environ.get('DAILY_MAX', 7.5))
+	except Exception:
+		daily_cap = 7.5
+	workers = int(os.environ['BATCH_WORKERS']) if os.environ.get('BATCH_WORKERS') else None
+	results = batch.solve_batch(sources, targets, workers=workers, daily_max=daily_cap, solver=solver, seed=seed,
+								weights=weights)
+	job.info['failed'] = sum(error is not None for _, _, error in results)
+	job.info['result_hash'] = batch_files.put(batch.zip_results(results, seed=seed))
 
-	return jsonify({'rows': rows, 'assigned_total': assigned_total, 'remaining': remaining})
+	from pretty_html_table import build_table
+	return build_table(pd.read_csv(io.StringIO(batch.summary(results, seed=seed)), sep=';', keep_default_na=False,
+								   dtype=str), 'blue_light')
 
 
 # run Flask app
@@ -268,4 +525,5 @@ if __name__ == '__main__':
 		port = int(os.environ.get('PORT', '5000'))
 	except ValueError:
 		port = 5000
+	app.config['READY'] = True
 	app.run(host=host, port=port, debug=True)
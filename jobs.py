@@ -0,0 +1,178 @@
+import concurrent.futures
+import contextlib
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+JOB_WORKERS = 2
+JOB_TTL = 3600
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def job_key(_digest, _form):
+	"""Returns the key of a submission from the hash of the file and the form, without its order"""
+	digest = hashlib.sha256(_digest.encode('utf-8'))
+	for key, value in sorted(_form.items()):
+		digest.update(f"\0{key}\0{value}".encode('utf-8'))
+	return digest.hexdigest()
+
+
+class Job:
+	def __init__(self, key, job_id=None):
+		self.id = job_id or uuid.uuid4().hex
+		self.key = key
+		self.status = PENDING
+		self.result = None
+		self.error = None
+		self.created = time.time()
+		self.finished = None
+		# stages and counters of the run, see metrics.start_trace
+		self.trace = None
+		# what the job function wants to report with the status, like the seed of a solve
+		self.info = {}
+
+	def to_dict(self):
+		return dict(self.info, id=self.id, status=self.status, error=self.error)
+
+
+class JobStore:
+	"""The status, info, trace and result of the jobs in a SQLite file, by job id.
+
+	The worker processes of the server share the file, so a job submitted to
+	one of them can be followed from any other. Every call opens its own
+	connection, as a connection cannot be used from another thread or after
+	a fork.
+	"""
+
+	def __init__(self, path):
+		self.path = os.path.abspath(path)
+		os.makedirs(os.path.dirname(self.path), exist_ok=True)
+		with self._connect() as db:
+			# readers do not wait for the writer
+			db.execute("PRAGMA journal_mode=WAL")
+			db.execute("CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, key TEXT, status TEXT, error TEXT, "
+					   "info TEXT, trace TEXT, result TEXT, created REAL, finished REAL)")
+			db.execute("CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key)")
+
+	def save(self, job):
+		with self._connect() as db:
+			db.execute("INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+					   (job.id, job.key, job.status, job.error, json.dumps(job.info), json.dumps(job.trace), job.result,
+						job.created, job.finished))
+
+	def load(self, job_id):
+		"""Returns the stored job with an id, None if there is none"""
+		with self._connect() as db:
+			row = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+		return None if row is None else self._job(row)
+
+	def find(self, key):
+		"""Returns the last stored job of a key that did not fail, None if there is none"""
+		with self._connect() as db:
+			row = db.execute("SELECT * FROM jobs WHERE key = ? AND status != ? ORDER BY created DESC LIMIT 1",
+							 (key, FAILED)).fetchone()
+		return None if row is None else self._job(row)
+
+	def expire(self, ttl):
+		"""Removes the jobs that ended more than ttl seconds ago"""
+		with self._connect() as db:
+			db.execute("DELETE FROM jobs WHERE finished < ?", (time.time() - ttl,))
+
+	def _job(self, row):
+		job = Job(row[1], job_id=row[0])
+		job.status, job.error, job.result, job.created, job.finished = row[2], row[3], row[6], row[7], row[8]
+		job.info, job.trace = json.loads(row[4]), json.loads(row[5])
+		return job
+
+	@contextlib.contextmanager
+	def _connect(self):
+		db = sqlite3.connect(self.path, timeout=30)
+		# the jobs are short lived: no sync to disk on every commit, only on checkpoints
+		db.execute("PRAGMA synchronous=NORMAL")
+		try:
+			with db:
+				yield db
+		finally:
+			db.close()
+
+
+class JobQueue:
+	"""Runs jobs on a local thread pool and keeps their results in memory.
+
+	At most ``workers`` jobs run at the same time. Submitting the same key
+	again returns the job already submitted, unless it failed, and finished
+	jobs are forgotten ``ttl`` seconds after they end. With a ``store`` (a
+	JobStore) every change of a job is saved to it, and the jobs and keys
+	that are not in memory are looked up there, so the queues of several
+	processes answer for each other's jobs.
+	"""
+
+	def __init__(self, workers=JOB_WORKERS, ttl=JOB_TTL, store=None):
+		self.ttl = ttl
+		self.store = store
+		self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='solve')
+		self._jobs = {}
+		self._by_key = {}
+		self._lock = threading.Lock()
+
+	def submit(self, key, fn, *args, **kwargs):
+		"""Runs fn(job, *args, **kwargs) in the pool, returning the job. The result of fn is stored in job.result"""
+		with self._lock:
+			self._expire()
+			job = self._jobs.get(self._by_key.get(key))
+			if job is None and self.store is not None:
+				self.store.expire(self.ttl)
+				job = self.store.find(key)
+			if job is not None and job.status != FAILED:
+				return job
+			job = Job(key)
+			self._jobs[job.id] = job
+			self._by_key[key] = job.id
+		self._save(job)
+		self._executor.submit(self._run, job, fn, args, kwargs)
+		return job
+
+	def get(self, job_id):
+		with self._lock:
+			self._expire()
+			job = self._jobs.get(job_id)
+		if job is None and self.store is not None:
+			job = self.store.load(job_id)
+			if job is not None and job.finished is not None and time.time() - job.finished > self.ttl:
+				return None
+		return job
+
+	def shutdown(self, wait=True):
+		self._executor.shutdown(wait=wait)
+
+	def _run(self, job, fn, args, kwargs):
+		job.status = RUNNING
+		self._save(job)
+		try:
+			job.result = fn(job, *args, **kwargs)
+			job.status = DONE
+		except Exception as e:
+			job.error = str(e)
+			job.status = FAILED
+		job.finished = time.time()
+		self._save(job)
+
+	def _save(self, job):
+		if self.store is not None:
+			self.store.save(job)
+
+	def _expire(self):
+		now = time.time()
+		expired = [job for job in self._jobs.values() if job.finished is not None and now - job.finished > self.ttl]
+		for job in expired:
+			del self._jobs[job.id]
+			if self._by_key.get(job.key) == job.id:
+				del self._by_key[job.key]
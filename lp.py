@@ -0,0 +1,127 @@
+import numpy as np
+
+import metrics
+from engine import EPSILON, MAX_HOUR_DAY, MAX_HOUR_WEEK, SolverException
+
+LP_TIME_LIMIT = 10.0
+LP_STEP = 0.5
+
+# weights of the objective: filling the days first, even distribution second
+FILL_WEIGHT = 100.0
+
+
+class LPFallback(Exception):
+	"""The exact solver could not give an answer and the greedy engine must be used"""
+	pass
+
+
+def solve_lp(_hours, _row_keys, _week_of_day, _hours_by_project, daily_max=MAX_HOUR_DAY, weekly_max=MAX_HOUR_WEEK,
+			 step=LP_STEP, time_limit=LP_TIME_LIMIT):
+	"""Solves the whole period as one integer program with the HiGHS solver of scipy.
+
+	The variables are the number of ``step`` slots added to each project row
+	and day; ``_hours`` already has the activity minimums, as the greedy engine
+	gets them from core.check_matrix. Days and weeks cannot go over
+	``daily_max`` and ``weekly_max`` and projects get exactly their target
+	(rounded to ``step``). Projects without a minimum (-1) fill the free hours. The peak hours
+	of every row and the largest total of the projects without a minimum are
+	minimised so the hours are evenly distributed between days and projects.
+
+	Raises LPFallback when scipy is not available or the time limit is hit,
+	and SolverException when the problem has no solution.
+	"""
+	# scipy takes a while to import, so it is only loaded by the first exact solve
+	try:
+		from scipy.optimize import Bounds, LinearConstraint, milp
+		from scipy.sparse import coo_matrix
+	except ImportError:
+		raise LPFallback("scipy no está instalado")
+
+	_hours = np.array(_hours, dtype=float)
+	num_days = _hours.shape[1]
+
+	# choose the rows that get new hours: one row per project
+	target_rows, fill_rows = {}, []
+	seen = set()
+	for index, key in enumerate(_row_keys):
+		if key in seen or key not in _hours_by_project:
+			continue
+		value = _hours_by_project[key]
+		if not isinstance(value, (int, float)):
+			continue
+		seen.add(key)
+		if value == -1:
+			fill_rows.append(index)
+		elif value > 0:
+			target_rows[index] = int(round(value / step))
+
+	var_rows = list(target_rows) + fill_rows
+	if not var_rows:
+		return _hours
+	num_slots = len(var_rows) * num_days
+	num_peaks = len(target_rows) + len(fill_rows)
+	global_peak = num_slots + num_peaks
+	num_vars = num_slots + num_peaks + 1
+
+	# bounds of the slot variables
+	lower = np.zeros(num_vars)
+	upper = np.full(num_vars, np.inf)
+	upper[:num_slots] = np.floor(daily_max / step + EPSILON)
+
+	cost = np.zeros(num_vars)
+	for v, index in enumerate(var_rows):
+		if index in fill_rows:
+			cost[v * num_days:(v + 1) * num_days] = -FILL_WEIGHT * step
+	cost[num_slots:global_peak] = step
+	cost[global_peak] = 1.0
+
+	rows, cols, vals, lows, ups = [], [], [], [], []
+
+	def add_constraint(_cols, _vals, low, up):
+		row = len(lows)
+		rows.extend([row] * len(_cols))
+		cols.extend(_cols)
+		vals.extend(_vals)
+		lows.append(low)
+		ups.append(up)
+
+	slots = np.arange(num_slots).reshape(len(var_rows), num_days)
+	used = _hours.sum(axis=0)
+	# daily cap
+	for day in range(num_days):
+		add_constraint(slots[:, day].tolist(), [step] * len(var_rows), -np.inf, daily_max - used[day])
+	# weekly cap
+	weeks = {}
+	for day, week in enumerate(_week_of_day):
+		weeks.setdefault(week, []).append(day)
+	for days in weeks.values():
+		_cols = slots[:, days].ravel().tolist()
+		add_constraint(_cols, [step] * len(_cols), -np.inf, weekly_max - used[days].sum())
+	# project targets
+	for v, index in enumerate(var_rows):
+		if index in target_rows:
+			add_constraint(slots[v].tolist(), [1.0] * num_days, target_rows[index], target_rows[index])
+	# peak hours of each project row
+	for v in range(num_peaks):
+		for day in range(num_days):
+			add_constraint([slots[v, day], num_slots + v], [1.0, -1.0], -np.inf, 0.0)
+	# largest total of the projects without a minimum
+	for v in range(len(target_rows), num_peaks):
+		add_constraint(slots[v].tolist() + [global_peak], [step] * num_days + [-1.0], -np.inf, 0.0)
+
+	matrix = coo_matrix((vals, (rows, cols)), shape=(len(lows), num_vars))
+	integrality = np.zeros(num_vars)
+	integrality[:global_peak] = 1
+	result = milp(cost, integrality=integrality, bounds=Bounds(lower, upper),
+				  constraints=LinearConstraint(matrix.tocsr(), lows, ups),
+				  options={"time_limit": time_limit, "mip_rel_gap": 0.05})
+
+	metrics.count("solver_iterations", int(getattr(result, 'mip_node_count', 0) or 0), solver="lp")
+	if result.status == 2:
+		raise SolverException("No existe ninguna asignación de horas que cumpla todas las restricciones.")
+	if result.status != 0 or result.x is None:
+		raise LPFallback(result.message)
+
+	added = np.round(result.x[:num_slots]).reshape(len(var_rows), num_days) * step
+	_hours[var_rows] += added
+	return _hours
@@ -4,39 +4,39 @@ import os
 import random
 
 import dateutil.parser as parser
+import numpy as np
 import pandas as pd
 
-MAX_HOUR_DAY = 7.5
+from core import SOLVERS, assign_projects, check_matrix, get_weeks, get_working_days, solve_sheet_matrix
+from engine import ACTIVITY_CODES, MAX_HOUR_DAY, SolverException
+from workcalendar import absent_days
 
 
-class SolverException(Exception):
-	pass
-
-
-def get_working_days(_first_date, _last_date):
-	"""Returns a list of the working days in a range of dates"""
-	_working_days = []
-	for date in pd.date_range(_first_date, _last_date):
-		if date.dayofweek < 5:
-			_working_days.append(date.strftime("%-d/%-m/%y"))
-	return _working_days
+def get_sheet_working_days(_df, _first_date, _last_date):
+	"""Returns the working days of a sheet: the calendar of its person without the days filled by absences"""
+	dni = _df['DNI'].iloc[0] if len(_df) else None
+	_working_days = get_working_days(_first_date, _last_date, dni=dni)
+	absent = absent_days(_df, _working_days, float(os.environ.get('DAILY_MAX', MAX_HOUR_DAY)))
+	return [day for day in _working_days if day not in absent]
 
 
 def read_df(_file):
-	_df = pd.read_csv(_file, encoding='iso-8859-1', sep=';')
+	# the DNI as text, with its leading zeros, as the absences file and csvio have it
+	_df = pd.read_csv(_file, encoding='iso-8859-1', sep=';', dtype={'DNI': str})
 	first_day, first_month, first_year = _df.columns[7].split('/')
 	first_year = '20' + first_year if len(first_year) == 2 else first_year
 	first_date = datetime.date(year=int(first_year), month=int(first_month), day=int(first_day))
 	last_day, last_month, last_year = _df.columns[-1].split('/')
 	last_year = '20' + last_year if len(last_year) == 2 else last_year
 	last_date = datetime.date(year=int(last_year), month=int(last_month), day=int(last_day))
-	_working_days = get_working_days(first_date, last_date)
-	_num_working_days = len(_working_days)
 
 	columns = _df.columns[7:]
 	columns = [parser.parse(x, dayfirst=True).strftime("%-d/%-m/%y") for x in columns]
 	_df.columns = _df.columns[:7].tolist() + columns
 
+	_working_days = get_sheet_working_days(_df, first_date, last_date)
+	_num_working_days = len(_working_days)
+
 	return _df, _working_days, _num_working_days
 
 
@@ -85,30 +85,27 @@ def generate_questions(_df):
 	return questions
 
 
-def solve_hours(_df, _hours_by_project, _working_days, daily_max=MAX_HOUR_DAY):
-	# iter dataframe by rows
-	for index, row in _df.iterrows():
-		project, wp = row['Proyecto'], row['Working Package']
-		if (project, wp) not in _hours_by_project:
-			continue
-		if _hours_by_project[(project, wp)] == -1:
-			continue
-		while _hours_by_project[(project, wp)] > 0:
-			for _day in _working_days:
-				pending_hours_in_day = daily_max - _df[_day].sum()
-				new_hours = min(min(1, _hours_by_project[(project, wp)]), pending_hours_in_day)
-				# update dataframe
-				_df.loc[index, _day] = _df.loc[index, _day] + new_hours
-				_hours_by_project[(project, wp)] -= new_hours
-	# projects without min hours restriction
-	projects_without_restriction = [key for key, value in _hours_by_project.items() if value == -1]
-	for _day in _working_days:
-		if len(projects_without_restriction) != 0:
-			project = random.choice(projects_without_restriction)
-			pending_hours_in_day = daily_max - _df[_day].sum()
-			# locate by two columns and row in df
-			_df.loc[(_df['Proyecto'] == project[0]) & (_df['Working Package'] == project[1]), _day] = pending_hours_in_day
+def solve_hours(_df, _hours_by_project, _working_days, daily_max=MAX_HOUR_DAY, rng=random, fill="random",
+				weights=None, slots=None):
+	# solve on a dense rows x working days matrix and write it back once
+	hours = _df[_working_days].to_numpy(dtype=float)
+	row_keys = list(zip(_df['Proyecto'], _df['Working Package']))
+	_df[_working_days] = assign_projects(hours, row_keys, _hours_by_project, daily_max=daily_max, rng=rng, fill=fill,
+										 weights=weights, slots=slots)
+
+	return _df
+
 
+def solve_month(_df, _working_days, _num_working_days, _other_activities, _hours_by_project, daily_max=MAX_HOUR_DAY,
+				solver="greedy", weeks=None, rng=random, fill="random", weights=None, weekly_max=None, slots=None,
+				info=None):
+	"""Checks and solves a sheet with the greedy engine or the exact solver (``solver="lp"``), see core.solve_sheet_matrix"""
+	_df = normalize_hours(_df, _working_days)
+	_df[_working_days] = solve_sheet_matrix(
+		_df[_working_days].to_numpy(dtype=float, copy=True), list(zip(_df['Proyecto'], _df['Working Package'])),
+		_df['Id Actividad'].to_numpy(), _working_days, _num_working_days, _other_activities, _hours_by_project,
+		daily_max=daily_max, solver=solver, weeks=weeks, rng=rng, fill=fill, weights=weights, weekly_max=weekly_max,
+		other_hours=other_day_hours(_df, _working_days), slots=slots, info=info)
 	return _df
 
 
@@ -118,91 +115,60 @@ def transform_df_to_str_types(_df, _working_days):
 	return _df
 
 
-def check_hours(_df, _working_days, _num_working_days, _other_activities, _hours_by_project):
-	used_hours = 0
-	# set df columns to float type with default value 0
-	activities = {"__teaching__": 97, "__other_id__": 98, "__other__": 100, "__lessons__": 108}
-
-	# allow overrides for daily/weekly caps via env vars
-	daily_cap = float(os.environ.get('DAILY_MAX', MAX_HOUR_DAY))
-	weekly_cap = float(os.environ.get('WEEKLY_MAX', 37.5))
-
+def normalize_hours(_df, _working_days):
+	"""Converts the working days columns to floats, accepting comma decimals and empty cells"""
+	dtypes = _df.dtypes
+	if all(pd.api.types.is_float_dtype(dtypes[day]) for day in _working_days):
+		# already floats, as csvio.read_df leaves them: only the empty cells to fill, at once
+		if _df[_working_days].isna().to_numpy().any():
+			_df[_working_days] = _df[_working_days].fillna(0)
+		return _df
 	for day in _working_days:
-		# normalize existing values
-		_df[day] = _df[day].apply(lambda x: float(str(x).replace(',', '.')) if x != '' else 0.0)
+		if pd.api.types.is_float_dtype(_df[day]):
+			if _df[day].hasnans:
+				_df[day] = _df[day].fillna(0)
+			continue
+		if not pd.api.types.is_numeric_dtype(_df[day]):
+			_df[day] = _df[day].replace('', '0').astype(str).str.replace(',', '.', regex=False)
 		_df[day] = _df[day].astype(float).fillna(0)
+	return _df
 
-		# total currently assigned this day (from CSV)
-		total_current = _df[day].sum()
-		available = max(0.0, daily_cap - total_current)
-
-		# collect per-activity needs (per-day minimums minus existing)
-		needs = []
-		for activity_key, activity_code in activities.items():
-			if activity_key in _other_activities:
-				value = _other_activities[activity_key]
-				if value != -1:
-					# existing hours for this activity on this day
-					existing = _df.loc[_df['Id Actividad'] == activity_code, day].sum()
-					need = max(0.0, float(value) - existing)
-					needs.append((activity_key, activity_code, need))
-
-		# allocate needs in deterministic order (teaching first etc.) without exceeding available
-		for activity_key, activity_code, need in needs:
-			if available <= 0:
-				break
-			alloc = min(need, available)
-			if alloc > 0:
-				# add allocation to the activity row(s) for that day
-				_df.loc[_df['Id Actividad'] == activity_code, day] = _df.loc[_df['Id Actividad'] == activity_code, day] + alloc
-				available -= alloc
-
-		# after allocations, compute used hours for the day
-		used_hours += _df[day].sum()
-
-	max_hours_month = daily_cap * _num_working_days - used_hours
-	# remaining capacity for project assignment should be non-negative
-	if max_hours_month < 0:
-		max_hours_month = 0
-
-	if sum([x for x in _hours_by_project.values() if x != -1]) > max_hours_month:
-		total_teaching_hours = _df.loc[_df['Id Actividad'] == 97, _df.columns[7:]].sum(axis=1).sum()
-		total_other_id_hours = _df.loc[_df['Id Actividad'] == 98, _df.columns[7:]].sum(axis=1).sum()
-		total_other_hours = _df.loc[_df['Id Actividad'] == 100, _df.columns[7:]].sum(axis=1).sum()
-		total_lessons_hours = _df.loc[_df['Id Actividad'] == 108, _df.columns[7:]].sum(axis=1).sum()
-		msg = f"Te has pasado de horas.\nEl máximo es de {MAX_HOUR_DAY}h al día y {MAX_HOUR_DAY * _num_working_days} horas este mes.\n"
-		if total_teaching_hours > 0:
-			msg += f"Has asignado {total_teaching_hours} horas de docencia\n"
-		if total_other_id_hours > 0:
-			msg += f"Has asignado {total_other_id_hours} horas de otras actividades de I+D\n"
-		if total_other_hours > 0:
-			msg += f"Has asignado {total_other_hours} horas de otras actividades\n"
-		if total_lessons_hours > 0:
-			msg += f"Has asignado {total_lessons_hours} horas de formación del participante\n"
-		raise SolverException(msg)
-
-	# daily check
-	for day in _working_days:
-		day_total = _df[day].sum()
-		if day_total > daily_cap + 1e-6:
-			raise SolverException(f"Se han asignado {day_total}h el día {day}, que supera el máximo diario de {daily_cap}h.")
 
-	# weekly check: group by ISO year-week
-	from dateutil import parser as _parser
-	week_sums = {}
-	for day in _working_days:
-		dt = _parser.parse(day, dayfirst=True)
-		yw = (dt.isocalendar().year, dt.isocalendar().week)
-		week_sums.setdefault(yw, 0.0)
-		week_sums[yw] += _df[day].sum()
+def check_hours(_df, _working_days, _num_working_days, _other_activities, _hours_by_project, _weeks=None,
+				daily_max=None, weekly_max=None):
+	"""Raises the activity rows to their daily minimums and checks the monthly, daily and weekly limits.
 
-	for yw, s in week_sums.items():
-		if s > weekly_cap + 1e-6:
-			raise SolverException(f"Semana {yw[0]}-W{yw[1]} tiene {s}h asignadas, que supera el máximo semanal de {weekly_cap}h.")
+	All the violations are reported together in the SolverException, see core.check_matrix.
+	"""
+	# set df columns to float type with default value 0
+	_df = normalize_hours(_df, _working_days)
+	hours = _df[_working_days].to_numpy(dtype=float)
+	checked = check_matrix(hours, _df['Id Actividad'].to_numpy(), _working_days, _num_working_days, _other_activities,
+						   _hours_by_project, weeks=_weeks, daily_max=daily_max, weekly_max=weekly_max,
+						   other_hours=other_day_hours(_df, _working_days))
+	if any(_other_activities.get(key, -1) != -1 for key in ACTIVITY_CODES):
+		_df[_working_days] = checked
 
 	return _df
 
 
+def other_day_hours(_df, _working_days):
+	"""Returns the hours of the day columns that are not working days, None if they are not numeric"""
+	working = set(_working_days)
+	try:
+		return np.nan_to_num(_df[[day for day in _df.columns[7:] if day not in working]].to_numpy(dtype=float))
+	except (TypeError, ValueError):
+		return None
+
+
+def sheet_hours(_df, _hours, _working_days):
+	"""Returns the hours of every day column of the sheet, or only the working days if the others are not numeric"""
+	try:
+		return np.nan_to_num(_df[_df.columns[7:]].to_numpy(dtype=float))
+	except (TypeError, ValueError):
+		return _hours
+
+
 if __name__ == '__main__':
 	# CSV data in memory
 	csv_data = """DNI;Nombre;Clave espec�fica;Proyecto;Id Actividad;Actividad;Working Package;1/2/23;2/2/23;3/2/23;4/2/23;5/2/23;6/2/23;7/2/23;8/2/23;9/2/23;10/2/23;11/2/23;12/2/23;13/2/23;14/2/23;15/2/23;16/2/23;17/2/23;18/2/23;19/2/23;20/2/23;21/2/23;22/2/23;23/2/23;24/2/23;25/2/23;26/2/23;27/2/23;28/2/23
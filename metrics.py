@@ -0,0 +1,150 @@
+"""Timers and counters of the hot paths, exported in the Prometheus text format.
+
+``stage(name)`` times a block: the time goes to the ``burrocracia_stage_seconds``
+histogram and to the trace of the current thread, if one was started with
+``start_trace()`` (the web app starts one per request and per solve job).
+``count(name, n)`` adds to a counter and to the trace.
+
+Set PROFILE_DIR to dump a cProfile ``.pstats`` file of every solve there.
+"""
+import contextlib
+import cProfile
+import os
+import threading
+import time
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+HELP = {
+	"burrocracia_request_seconds": "Latency of the HTTP requests by route",
+	"burrocracia_stage_seconds": "Time spent in every stage of a request or solve",
+	"burrocracia_solve_rows_total": "Rows of the solved sheets",
+	"burrocracia_solve_days_total": "Working days of the solved sheets",
+	"burrocracia_solver_iterations_total": "Project rows allocated by the greedy engine and MIP nodes of the exact solver",
+	"burrocracia_solves_total": "Solves by solver and result",
+}
+
+
+class Histogram:
+	def __init__(self, buckets=LATENCY_BUCKETS):
+		self.buckets = buckets
+		self.counts = [0] * len(buckets)
+		self.sum = 0.0
+		self.count = 0
+
+	def observe(self, value):
+		for i, bound in enumerate(self.buckets):
+			if value <= bound:
+				self.counts[i] += 1
+		self.sum += value
+		self.count += 1
+
+
+class Registry:
+	"""Histograms and counters by metric name and labels"""
+
+	def __init__(self):
+		self._histograms = {}
+		self._counters = {}
+		self._lock = threading.Lock()
+
+	def observe(self, name, value, **labels):
+		key = (name, tuple(sorted(labels.items())))
+		with self._lock:
+			histogram = self._histograms.get(key)
+			if histogram is None:
+				histogram = self._histograms[key] = Histogram()
+			histogram.observe(value)
+
+	def inc(self, name, value=1, **labels):
+		key = (name, tuple(sorted(labels.items())))
+		with self._lock:
+			self._counters[key] = self._counters.get(key, 0) + value
+
+	def render(self):
+		"""Returns every metric in the Prometheus text exposition format"""
+		lines = []
+		with self._lock:
+			typed = set()
+			for (name, labels), histogram in sorted(self._histograms.items()):
+				if name not in typed:
+					typed.add(name)
+					lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} histogram"]
+				for bound, count in zip(histogram.buckets, histogram.counts):
+					lines.append(f"{name}_bucket{format_labels(labels + (('le', repr(bound)),))} {count}")
+				lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+				lines.append(f"{name}_sum{format_labels(labels)} {histogram.sum}")
+				lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+			for (name, labels), value in sorted(self._counters.items()):
+				if name not in typed:
+					typed.add(name)
+					lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} counter"]
+				lines.append(f"{name}{format_labels(labels)} {value}")
+		return "\n".join(lines) + "\n"
+
+
+def format_labels(_labels):
+	if not _labels:
+		return ""
+	escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in _labels)
+	return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(_labels, escaped)) + "}"
+
+
+registry = Registry()
+_local = threading.local()
+
+
+def start_trace():
+	"""Starts collecting the stages and counters of the current thread and returns the trace"""
+	_local.trace = {"stages": {}, "counters": {}}
+	return _local.trace
+
+
+def stop_trace():
+	trace = getattr(_local, "trace", None)
+	_local.trace = None
+	return trace
+
+
+@contextlib.contextmanager
+def stage(name):
+	"""Times a block as a stage"""
+	start = time.perf_counter()
+	try:
+		yield
+	finally:
+		elapsed = time.perf_counter() - start
+		registry.observe("burrocracia_stage_seconds", elapsed, stage=name)
+		trace = getattr(_local, "trace", None)
+		if trace is not None:
+			trace["stages"][name] = trace["stages"].get(name, 0.0) + elapsed
+
+
+def count(name, value=1, **labels):
+	"""Adds to the counter burrocracia_<name>_total and to the current trace"""
+	registry.inc(f"burrocracia_{name}_total", value, **labels)
+	trace = getattr(_local, "trace", None)
+	if trace is not None:
+		trace["counters"][name] = trace["counters"].get(name, 0) + value
+
+
+def server_timing(_trace):
+	"""Returns the stages of a trace as a Server-Timing header value, in milliseconds"""
+	return ", ".join(f"{name.replace(' ', '_')};dur={seconds * 1000:.2f}" for name, seconds in _trace["stages"].items())
+
+
+@contextlib.contextmanager
+def profiled(name):
+	"""Profiles a block with cProfile and dumps it to PROFILE_DIR/<name>.pstats, only if PROFILE_DIR is set"""
+	folder = os.environ.get('PROFILE_DIR')
+	if not folder:
+		yield
+		return
+	profiler = cProfile.Profile()
+	profiler.enable()
+	try:
+		yield
+	finally:
+		profiler.disable()
+		os.makedirs(folder, exist_ok=True)
+		profiler.dump_stats(os.path.join(folder, f"{name}.pstats"))
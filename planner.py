@@ -0,0 +1,213 @@
+"""Plans a whole year: the yearly hours of every project spread over its monthly sheets.
+
+The targets file is a ``;`` separated CSV with the columns ``Proyecto``,
+``Working Package`` and ``Horas``, the hours of the whole year (-1 for no
+minimum); the activities use their form names (``__teaching__``...) with the
+daily minimum as hours, as in the batch manifest. Projects left out get 0.
+
+The months are planned in date order on a projects x months matrix: every
+project gets the part of what is left of its target that matches the share
+of the free hours of the month among the months still to come, and what a
+month can not take is carried to the next ones. Hours already in the sheets
+count towards the target. Then every month is solved with its share and one
+solved CSV is written per month, with plan.csv holding the plan; the share of
+a month that can not be solved goes to the months after it.
+
+Run with ``python planner.py <directorio|zip> <objetivos.csv> [-o results]``.
+"""
+import argparse
+import csv
+import io
+import os
+import random
+
+import numpy as np
+
+import batch
+import csvio
+from core import SOLVERS, check_matrix, project_keys, solve_sheet_matrix
+from engine import ACTIVITY_CODES, EPSILON, FILL_STRATEGIES, MAX_HOUR_DAY, SolverException
+
+TARGET_COLUMNS = ["Proyecto", "Working Package", "Horas"]
+PLAN_FILE = "plan.csv"
+PLAN_STEP = 0.5
+
+
+def read_targets(_file):
+	"""Returns the yearly targets of a targets file: {(proyecto, wp): horas}"""
+	reader = csv.DictReader(_file, delimiter=';')
+	missing = [c for c in TARGET_COLUMNS if c not in (reader.fieldnames or [])]
+	if missing:
+		raise SolverException(f"Faltan columnas en los objetivos: {', '.join(missing)}")
+	return {(row["Proyecto"].strip(), int(row["Working Package"] or -1)): float(row["Horas"].replace(',', '.'))
+			for row in reader}
+
+
+class Month:
+	"""A monthly sheet with its free hours once the activity minimums are in"""
+
+	def __init__(self, name, sheet):
+		self.name = name
+		self.sheet = sheet
+		self.date = csvio.label_date(sheet.labels[0])
+		self.label = self.date.strftime('%m/%Y')
+		self.free = 0.0
+		self.error = None
+
+	def check(self, _other_activities, daily_max=MAX_HOUR_DAY):
+		"""Sets the free hours of the month and returns the hours of every row, None if the sheet is wrong"""
+		sheet = self.sheet
+		try:
+			hours = check_matrix(sheet.working_hours(), sheet.activity_ids, sheet.working_days, sheet.num_working_days,
+								 dict(_other_activities), {}, weeks=sheet.weeks, daily_max=daily_max,
+								 other_hours=sheet.other_hours())
+		except SolverException as e:
+			self.error = str(e)
+			return None
+		self.free = max(0.0, daily_max * sheet.num_working_days - float(hours.sum()))
+		return hours.sum(axis=1)
+
+
+def load_months(_sources):
+	"""Returns a Month for every sheet, in date order"""
+	months = [Month(name, csvio.load_sheet(io.BytesIO(data))) for name, data in _sources]
+	return sorted(months, key=lambda month: month.date)
+
+
+def plan_hours(_targets, _present, _done, _free, step=PLAN_STEP, whole_steps=False):
+	"""Returns the hours of every project (row) in every month (column) and the hours left without a month.
+
+	``_present`` tells the months with a row of the project, ``_done`` the
+	hours already in them and ``_free`` the free hours of every month. Shares
+	are cut to multiples of ``step``, or to cents in the last month of a
+	project unless ``whole_steps``, as the slot mode only places whole slots,
+	and the cut goes to the next months.
+	"""
+	remaining = np.clip(_targets - _done.sum(axis=1), 0.0, None)
+	capacity = _present * _free[None, :]
+	# free hours of a month and of every month after it, by project
+	ahead = np.cumsum(capacity[:, ::-1], axis=1)[:, ::-1]
+	last = _present & (np.cumsum(_present[:, ::-1], axis=1)[:, ::-1] == 1)
+	plan = np.zeros_like(capacity)
+	for month in range(capacity.shape[1]):
+		share = np.divide(remaining * capacity[:, month], ahead[:, month], out=np.zeros_like(remaining),
+						  where=ahead[:, month] > 0)
+		total = share.sum()
+		if total > _free[month]:
+			share *= _free[month] / total
+		# cut down, so the shares never add up to more than the free hours
+		cut = np.floor(share / step + EPSILON) * step
+		share = cut if whole_steps else np.where(last[:, month], np.floor(share * 100 + EPSILON) / 100, cut)
+		plan[:, month] = share
+		remaining -= share
+	return plan, remaining
+
+
+def replan(_plan, _remaining, _present, _free, _column, step=PLAN_STEP, whole_steps=False):
+	"""Returns the plan and the hours left with the share of a month moved to the months after it"""
+	plan = _plan.copy()
+	after = slice(_column + 1, None)
+	left = _remaining + plan[:, _column:].sum(axis=1)
+	plan[:, _column] = 0.0
+	plan[:, after], remaining = plan_hours(left, _present[:, after], np.zeros_like(plan[:, after]), _free[after],
+										   step=step, whole_steps=whole_steps)
+	return plan, remaining
+
+
+def plan_year(_months, _targets, _other_activities, daily_max=MAX_HOUR_DAY, step=PLAN_STEP, whole_steps=False):
+	"""Returns the project keys with a target, the months with a row of each one, the plan and the hours that do not fit"""
+	keys = [key for key, value in _targets.items() if value != -1 and key[0] not in ACTIVITY_CODES]
+	position = {key: i for i, key in enumerate(keys)}
+	present = np.zeros((len(keys), len(_months)), dtype=bool)
+	done = np.zeros((len(keys), len(_months)))
+	for column, month in enumerate(_months):
+		row_hours = month.check(_other_activities, daily_max=daily_max)
+		if row_hours is None:
+			continue
+		for key, hours in zip(month.sheet.row_keys, row_hours):
+			if key in position:
+				present[position[key], column] = True
+				done[position[key], column] += hours
+	targets = np.array([_targets[key] for key in keys], dtype=float)
+	plan, remaining = plan_hours(targets, present, done, np.array([month.free for month in _months]), step=step,
+								 whole_steps=whole_steps)
+	return keys, present, plan, remaining
+
+
+def solve_year(_sources, _targets, daily_max=MAX_HOUR_DAY, solver="greedy", seed=None, fill="random", slots=None):
+	"""Plans and solves the monthly sheets of a year.
+
+	Returns the solved months as (name, csv bytes, error), like batch.solve_batch,
+	the months, the project keys, their plan and the hours that do not fit.
+	With ``slots`` the plan is made in whole slots.
+	"""
+	other_activities = {key: _targets.get((key, -1), -1) for key in ACTIVITY_CODES}
+	months = load_months(_sources)
+	step = PLAN_STEP if slots is None else slots.slot
+	keys, present, plan, remaining = plan_year(months, _targets, other_activities, daily_max=daily_max, step=step,
+											   whole_steps=slots is not None)
+	free = np.array([month.free for month in months])
+	rng = random.Random(seed)
+	results = []
+	for column, month in enumerate(months):
+		if month.error is not None:
+			results.append((month.name, None, month.error))
+			continue
+		month_targets = dict(_targets)
+		month_targets.update((key, float(plan[i, column])) for i, key in enumerate(keys))
+		sheet = month.sheet
+		hours_by_project, _ = batch.person_targets(project_keys(sheet.row_keys, sheet.activity_ids),
+												   {'*': month_targets}, month.name)
+		try:
+			solved = solve_sheet_matrix(sheet.working_hours(), sheet.row_keys, sheet.activity_ids, sheet.working_days,
+										sheet.num_working_days, dict(other_activities), hours_by_project,
+										daily_max=daily_max, solver=solver, weeks=sheet.weeks, rng=rng, fill=fill,
+										other_hours=sheet.other_hours(), slots=slots)
+		except SolverException as e:
+			results.append((month.name, None, str(e)))
+			plan, remaining = replan(plan, remaining, present, free, column, step=step, whole_steps=slots is not None)
+			continue
+		output = io.BytesIO()
+		sheet.write(output, solved)
+		results.append((month.name, output.getvalue(), None))
+	return results, months, keys, plan, remaining
+
+
+def plan_report(_months, _keys, _plan, _remaining):
+	"""Returns the text of the plan: the hours of every project by month, its total and the hours left"""
+	output = io.StringIO()
+	writer = csv.writer(output, delimiter=';', lineterminator='\n')
+	writer.writerow(["Proyecto", "Working Package"] + [month.label for month in _months] + ["Total", "Pendiente"])
+	table = np.column_stack([_plan, _plan.sum(axis=1), np.clip(_remaining, 0.0, None)]).round(2)
+	for (project, wp), cells in zip(_keys, csvio.format_hours(table)):
+		writer.writerow([project, wp] + [cell or '0' for cell in cells])
+	return output.getvalue()
+
+
+if __name__ == '__main__':
+	arg_parser = argparse.ArgumentParser(description="Reparte las horas anuales de los proyectos entre las hojas de cada mes.")
+	arg_parser.add_argument("input", help="directorio o ZIP con los CSV de los meses")
+	arg_parser.add_argument("targets", help="CSV con las horas anuales de cada proyecto")
+	arg_parser.add_argument("-o", "--output", default="results", help="directorio de salida")
+	arg_parser.add_argument("-s", "--solver", choices=SOLVERS, default="greedy")
+	arg_parser.add_argument("--seed", type=int, default=None, help="semilla (por defecto, una nueva en el resumen)")
+	arg_parser.add_argument("--fill", choices=list(FILL_STRATEGIES), default="random",
+							help="reparto de los proyectos sin mínimo")
+	batch.add_slot_arguments(arg_parser)
+	args = arg_parser.parse_args()
+
+	sources, _, _ = batch.load_sources(args.input)
+	with open(args.targets, encoding='utf-8') as f:
+		targets = read_targets(f)
+	seed = batch.new_seed() if args.seed is None else args.seed
+	results, months, keys, plan, remaining = solve_year(
+		sources, targets, daily_max=float(os.environ.get('DAILY_MAX', MAX_HOUR_DAY)), solver=args.solver, seed=seed,
+		fill=args.fill, slots=batch.slot_rules(arg_parser, args))
+	batch.write_results(results, args.output, seed=seed)
+	with open(os.path.join(args.output, PLAN_FILE), 'w', encoding='utf-8') as f:
+		f.write(plan_report(months, keys, plan, remaining))
+	for (project, wp), left in zip(keys, remaining):
+		if left > EPSILON:
+			print(f"No caben {round(float(left), 2)}h del proyecto {project} (WP {wp}) en el año.")
+	failed = [name for name, _, error in results if error]
+	print(f"{len(results) - len(failed)} meses resueltos, {len(failed)} con errores. Plan en {os.path.join(args.output, PLAN_FILE)}")
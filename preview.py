@@ -0,0 +1,235 @@
+import collections
+import concurrent.futures
+import os
+import random
+import threading
+import uuid
+
+import numpy as np
+
+import metrics
+from engine import (EPSILON, MAX_HOUR_DAY, MAX_HOUR_WEEK, SolverException, allocate_row, fill_unconstrained,
+					remaining_capacity, row_targets)
+from main import sheet_hours, solve_month
+from validation import MONTHLY, RowIndex, Violation, apply_minimums, find_violations, monthly_message
+
+PREVIEW_SESSIONS = 256
+SCENARIO_WORKERS = 4
+
+ACTIVITY_NAMES = {97: 'Docencia', 98: 'Otros proyectos I+D', 99: 'Ausencias/Vacaciones', 100: 'Otras actividades',
+				  108: 'Formación participante'}
+
+
+def row_labels(_df):
+	"""Returns the project, activity and WP shown in the preview for every row"""
+	labels = []
+	for project, actividad, idcode, wp in zip(_df['Proyecto'], _df['Actividad'], _df['Id Actividad'],
+											  _df['Working Package']):
+		actividad = actividad if str(actividad).strip() != '' else ''
+		try:
+			idcode = int(idcode)
+		except Exception:
+			idcode = None
+		# activity rows are shown with the name of the activity instead of the project
+		if idcode in ACTIVITY_NAMES:
+			actividad = ACTIVITY_NAMES[idcode]
+			project = actividad
+		labels.append({'project': project, 'actividad': actividad, 'wp': int(wp)})
+	return labels
+
+
+class PreviewState:
+	"""Solver state of one preview session over one upload.
+
+	The activity minimums are checked once per combination of minimums, and the
+	capacity left before every project row is kept so a change in one project
+	target only re-solves the rows from that project on. The fill of the
+	projects without a minimum uses the seed of the session, so the result is
+	the same as a full recompute with ``random.Random(seed)``. With ``slots``
+	(an engine.SlotRules) every change is solved from scratch in slots, as
+	/solve does. Every answer gets a new random ``version``.
+	"""
+
+	def __init__(self, upload, seed=0, daily_max=MAX_HOUR_DAY, slots=None):
+		self.upload = upload
+		self.seed = seed
+		self.daily_max = daily_max
+		self.slots = slots
+		self.row_keys = list(zip(upload.df['Proyecto'], upload.df['Working Package']))
+		self.labels = row_labels(upload.df)
+		self.rows = RowIndex(upload.df['Id Actividad'].to_numpy())
+		self.lock = threading.Lock()
+		self._checked = {}
+		self._other = None
+		self._targets = None
+		self._allocations = None
+		self._capacities = None
+		self._totals = None
+		self.version = None
+
+	def full(self, _other_activities, _hours_by_project, solver="greedy", fill="random", weights=None):
+		"""Solves the sheet from scratch, as /solve does"""
+		upload = self.upload
+		solved_df = solve_month(upload.frame(), upload.working_days, upload.num_working_days, dict(_other_activities),
+								dict(_hours_by_project), daily_max=self.daily_max, solver=solver, weeks=upload.weeks,
+								rng=random.Random(self.seed), fill=fill, weights=weights, slots=self.slots)
+		return solved_df[upload.working_days].to_numpy(dtype=float)
+
+	def solve(self, _other_activities, _hours_by_project, solver="greedy", fill="random", weights=None, version=None):
+		"""Returns the indexes of the rows whose hours changed since the answer ``version`` and the solved hours.
+
+		Every row is returned when ``version`` is not the last answer of this
+		state, as the client may hold the answer of another worker, an older
+		one or none.
+		"""
+		with metrics.stage("preview_solve"):
+			if solver == "greedy" and self.slots is None:
+				hours = self._update(_other_activities, _hours_by_project, fill=fill, weights=weights)
+			else:
+				hours = self.full(_other_activities, _hours_by_project, solver=solver, fill=fill, weights=weights)
+				self._targets = None
+		totals = hours.sum(axis=1)
+		if self._totals is None or version is None or version != self.version:
+			changed = list(range(len(totals)))
+		else:
+			changed = np.flatnonzero(np.abs(totals - self._totals) > 1e-9).tolist()
+		self._totals = totals
+		self.version = uuid.uuid4().hex
+		return changed, hours
+
+	def _update(self, _other_activities, _hours_by_project, fill="random", weights=None):
+		# re-solve the project rows from the first one whose target changed
+		base, max_hours_month, violations, activity_totals = self._check(_other_activities)
+		requested = sum([x for x in _hours_by_project.values() if x != -1])
+		if requested > max_hours_month + EPSILON:
+			monthly = Violation(MONTHLY, None, requested, max_hours_month,
+								monthly_message(self.upload.num_working_days, activity_totals))
+			violations = [monthly] + violations
+		if violations:
+			raise SolverException("\n".join(v.message.rstrip("\n") for v in violations), violations)
+
+		targets = row_targets(self.row_keys, _hours_by_project)
+		start = 0
+		if _other_activities == self._other and self._targets is not None:
+			start = next((i for i, (a, b) in enumerate(zip(targets, self._targets)) if a != b), len(targets))
+
+		allocations = np.zeros_like(base) if start == 0 else self._allocations.copy()
+		capacities = np.empty((len(targets) + 1, base.shape[1])) if start == 0 else self._capacities.copy()
+		if start == 0:
+			capacities[0] = remaining_capacity(base, self.daily_max)
+		for index in range(start, len(targets)):
+			allocations[index] = 0.0
+			if targets[index] is not None:
+				allocations[index] = allocate_row(capacities[index], self.row_keys[index], targets[index])
+			capacities[index + 1] = capacities[index] - allocations[index]
+
+		self._other = dict(_other_activities)
+		self._targets = targets
+		self._allocations = allocations
+		self._capacities = capacities
+		return fill_unconstrained(base + allocations, self.row_keys, _hours_by_project, daily_max=self.daily_max,
+								  rng=random.Random(self.seed), strategy=fill, weights=weights)
+
+	def _check(self, _other_activities):
+		# activity minimums are checked once and kept: base matrix, free hours of the month, daily/weekly
+		# violations and the hours of every activity for the monthly message
+		key = tuple(sorted(_other_activities.items()))
+		if key not in self._checked:
+			upload = self.upload
+			daily_cap = float(os.environ.get('DAILY_MAX', MAX_HOUR_DAY))
+			weekly_cap = float(os.environ.get('WEEKLY_MAX', MAX_HOUR_WEEK))
+			hours = upload.df[upload.working_days].to_numpy(dtype=float)
+			base = apply_minimums(hours.copy(), self.rows, _other_activities, daily_max=daily_cap)
+			violations = find_violations(base, upload.working_days, upload.weeks, upload.num_working_days, 0,
+										 daily_max=daily_cap, weekly_max=weekly_cap)
+			activity_totals = self.rows.totals(sheet_hours(upload.df, hours, upload.working_days))
+			for code, total in self.rows.totals(base - hours).items():
+				activity_totals[code] += total
+			max_hours_month = max(0.0, daily_cap * upload.num_working_days - base.sum())
+			self._checked[key] = (base, max_hours_month, violations, activity_totals)
+		return self._checked[key]
+
+
+class PreviewSessions:
+	"""Preview states by session and upload, dropping the least recently used ones"""
+
+	def __init__(self, max_sessions=PREVIEW_SESSIONS):
+		self.max_sessions = max_sessions
+		self._states = collections.OrderedDict()
+		self._lock = threading.Lock()
+
+	def get(self, session, upload, daily_max=MAX_HOUR_DAY, seed=0, slots=None):
+		with self._lock:
+			state = self._states.get(session)
+			if (state is None or state.upload is not upload or state.daily_max != daily_max or state.seed != seed
+					or state.slots != slots):
+				state = PreviewState(upload, seed=seed, daily_max=daily_max, slots=slots)
+				self._states[session] = state
+			self._states.move_to_end(session)
+			while len(self._states) > self.max_sessions:
+				self._states.popitem(last=False)
+			return state
+
+
+def compare_scenarios(upload, _scenarios, seed=0, daily_max=MAX_HOUR_DAY, solver="greedy", fill="random",
+					  workers=SCENARIO_WORKERS, slots=None):
+	"""Solves several (activity minimums, hours by project, weights) scenarios of one upload together.
+
+	The greedy scenarios with the same minimums share a PreviewState: the
+	minimums are checked once and, solved in the order of their targets, every
+	scenario only re-solves the rows from its first target that differs from
+	the previous one; with ``slots`` every scenario is solved from scratch. The
+	groups are solved in parallel threads. Returns the
+	solved hours of every scenario, or its SolverException, in order.
+	"""
+	groups = collections.OrderedDict()
+	for index, (other, _, _) in enumerate(_scenarios):
+		key = tuple(sorted(other.items())) if solver == "greedy" and slots is None else index
+		groups.setdefault(key, []).append(index)
+	results = [None] * len(_scenarios)
+
+	def solve_group(indexes):
+		state = PreviewState(upload, seed=seed, daily_max=daily_max, slots=slots)
+		order = sorted(indexes, key=lambda i: [-1.0 if target is None else float(target)
+											   for target in row_targets(state.row_keys, _scenarios[i][1])])
+		for index in order:
+			try:
+				other, hours_by_project, weights = _scenarios[index]
+				results[index] = state.solve(other, hours_by_project, solver=solver, fill=fill, weights=weights)[1]
+			except SolverException as e:
+				results[index] = e
+
+	with metrics.stage("compare_scenarios"):
+		if workers <= 1 or len(groups) <= 1:
+			for indexes in groups.values():
+				solve_group(indexes)
+		else:
+			with concurrent.futures.ThreadPoolExecutor(max_workers=min(workers, len(groups))) as executor:
+				list(executor.map(solve_group, groups.values()))
+	return results
+
+
+def scenario_report(_labels, _names, _results, daily_max=MAX_HOUR_DAY, num_working_days=0):
+	"""Returns the totals of every scenario and their difference with the first one solved, by row.
+
+	The diff lists the rows whose total changed and by how much, against the
+	scenario named in ``reference``; a scenario that cannot be solved has its
+	error instead of totals.
+	"""
+	reference = next((index for index, hours in enumerate(_results) if not isinstance(hours, SolverException)), None)
+	base = None if reference is None else _results[reference].sum(axis=1)
+	scenarios = []
+	for name, hours in zip(_names, _results):
+		if isinstance(hours, SolverException):
+			scenarios.append({'name': name, 'error': str(hours), 'violations': [v.to_dict() for v in hours.violations]})
+			continue
+		totals = hours.sum(axis=1)
+		assigned_total = float(totals.sum())
+		scenarios.append({'name': name, 'totals': totals.tolist(), 'assigned_total': assigned_total,
+						  'remaining': daily_max * num_working_days - assigned_total, 'reference': _names[reference],
+						  'diff': [dict(_labels[index], index=int(index), delta=float(totals[index] - base[index]))
+								   for index in np.flatnonzero(np.abs(totals - base) > 1e-9)]})
+	return scenarios
+
+
+sessions = PreviewSessions()
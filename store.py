@@ -0,0 +1,187 @@
+"""Content-addressed storage of uploads and results.
+
+Every file is stored once under the SHA-256 of its content, as
+``<folder>/<first two hex digits>/<hash><suffix>``, so identical uploads and
+identical solved sheets share one file. The store keeps an index of the files
+with their size and last use, rebuilt from the folder on start, and a
+background thread, started with the store and again in a forked child,
+removes the files not used for ``max_age`` seconds and the least recently
+used ones while the store is over ``max_bytes``.
+
+Several processes can share the folder: a file stored by another one is
+added to the index when it is asked for, and the last use is also kept as
+the modification time of the file, so a process does not remove a file
+that another one is using.
+"""
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+
+STORE_MAX_MB = 512
+STORE_MAX_AGE = 7 * 24 * 3600
+EVICT_INTERVAL = 60
+
+DIGEST = re.compile(r'^[0-9a-f]{64}$')
+
+
+class BlobStore:
+	def __init__(self, folder, suffix='', max_bytes=STORE_MAX_MB * 1024 * 1024, max_age=STORE_MAX_AGE,
+				 interval=EVICT_INTERVAL):
+		# absolute, as flask.send_file takes relative paths from the app folder
+		self.folder = os.path.abspath(folder)
+		self.suffix = suffix
+		self.max_bytes = max_bytes
+		self.max_age = max_age
+		self.interval = interval
+		self.size = 0
+		self._entries = {}
+		self._lock = threading.Lock()
+		self._thread = None
+		os.makedirs(self.folder, exist_ok=True)
+		self._scan()
+		self.start()
+		# threads do not survive a fork, as gunicorn forks the workers from the preloaded app
+		os.register_at_fork(after_in_child=self._restart)
+
+	def put(self, data):
+		"""Stores data, once per content, and returns its hash"""
+		digest = hashlib.sha256(data).hexdigest()
+		path = self._path(digest)
+		with self._lock:
+			known = digest in self._entries
+		if known and self._touch(path):
+			with self._lock:
+				if digest in self._entries:
+					self._entries[digest][1] = time.time()
+			return digest
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		# write aside and rename, so a reader never sees half a file
+		fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp')
+		with os.fdopen(fd, 'wb') as f:
+			f.write(data)
+		os.replace(tmp, path)
+		with self._lock:
+			if digest not in self._entries:
+				self.size += len(data)
+			self._entries[digest] = [len(data), time.time()]
+		return digest
+
+	def path(self, digest):
+		"""Returns the path of a stored hash and marks it as used, None if it is not stored"""
+		if not DIGEST.match(digest or ''):
+			return None
+		path = self._path(digest)
+		size = self._touch(path)
+		with self._lock:
+			entry = self._entries.get(digest)
+			if size is None:
+				if entry is not None:
+					self.size -= self._entries.pop(digest)[0]
+				return None
+			if entry is None:
+				# stored by another process
+				self._entries[digest] = [size, time.time()]
+				self.size += size
+			else:
+				entry[1] = time.time()
+		return path
+
+	def recent(self, count):
+		"""Returns the hashes of the last used files, the most recent first"""
+		with self._lock:
+			return sorted(self._entries, key=lambda digest: self._entries[digest][1], reverse=True)[:count]
+
+	def __contains__(self, digest):
+		with self._lock:
+			return digest in self._entries
+
+	def evict(self):
+		"""Removes the expired files and the least recently used ones over the size limit"""
+		self._refresh()
+		now = time.time()
+		with self._lock:
+			removed = [digest for digest, (_, used) in self._entries.items() if now - used > self.max_age]
+			size = self.size - sum(self._entries[digest][0] for digest in removed)
+			for digest, (bytes_, _) in sorted(self._entries.items(), key=lambda item: item[1][1]):
+				if size <= self.max_bytes:
+					break
+				if digest not in removed:
+					removed.append(digest)
+					size -= bytes_
+			for digest in removed:
+				self.size -= self._entries.pop(digest)[0]
+		for digest in removed:
+			try:
+				os.remove(self._path(digest))
+			except FileNotFoundError:
+				pass
+		return removed
+
+	def start(self):
+		"""Starts the eviction thread, once"""
+		if self._thread is None and self.interval:
+			self._thread = threading.Thread(target=self._run, name=f'evict-{os.path.basename(self.folder)}', daemon=True)
+			self._thread.start()
+
+	def _restart(self):
+		# a lock held by the thread of the parent stays held in the child
+		self._lock = threading.Lock()
+		self._thread = None
+		self.start()
+
+	def _touch(self, path):
+		# marks a file as used for every process and returns its size, None if it is gone
+		try:
+			os.utime(path)
+			return os.path.getsize(path)
+		except OSError:
+			return None
+
+	def _refresh(self):
+		# the last use of every file by any process, from its modification time
+		with self._lock:
+			digests = list(self._entries)
+		used = {}
+		for digest in digests:
+			try:
+				used[digest] = os.stat(self._path(digest)).st_mtime
+			except FileNotFoundError:
+				used[digest] = None
+		with self._lock:
+			for digest, mtime in used.items():
+				entry = self._entries.get(digest)
+				if entry is None:
+					continue
+				if mtime is None:
+					self.size -= self._entries.pop(digest)[0]
+				else:
+					entry[1] = max(entry[1], mtime)
+
+	def _run(self):
+		while True:
+			time.sleep(self.interval)
+			self.evict()
+
+	def _path(self, digest):
+		return os.path.join(self.folder, digest[:2], digest + self.suffix)
+
+	def _scan(self):
+		# index the files already in the folder, by their modification time
+		for prefix in os.listdir(self.folder):
+			subfolder = os.path.join(self.folder, prefix)
+			if len(prefix) != 2 or not os.path.isdir(subfolder):
+				continue
+			for name in os.listdir(subfolder):
+				digest = name[:-len(self.suffix)] if self.suffix and name.endswith(self.suffix) else name
+				if DIGEST.match(digest) and digest.startswith(prefix):
+					stat = os.stat(os.path.join(subfolder, name))
+					self._entries[digest] = [stat.st_size, stat.st_mtime]
+					self.size += stat.st_size
+
+
+def from_env(folder, suffix=''):
+	return BlobStore(folder, suffix=suffix, max_bytes=float(os.environ.get('STORE_MAX_MB', STORE_MAX_MB)) * 1024 * 1024,
+					 max_age=float(os.environ.get('STORE_MAX_AGE', STORE_MAX_AGE)))
@@ -0,0 +1,70 @@
+"""The incremental preview against a full solve, see preview.PreviewState.
+
+Every case makes a run of random changes to the targets and the activity
+minimums of one session and checks each answer of PreviewState.solve with
+PreviewState.full of the same form, errors included, and that the changed
+rows bring the table of the last answer up to date.
+"""
+import random
+
+import numpy as np
+import pytest
+
+import csvio
+from benchmarks.generator import make_sheet, make_targets
+from cache import UploadCache
+from engine import ACTIVITY_CODES, FILL_STRATEGIES, SolverException
+from preview import PreviewState
+
+CASES = 40
+STEPS = 25
+
+
+def random_upload(rnd):
+	"""Returns a parsed synthetic sheet and its project keys"""
+	text, keys = make_sheet(projects=rnd.randint(1, 8), wps=rnd.choice([1, 2]), teaching=rnd.random() * 0.5,
+							prefill=rnd.random() * 0.3, seed=rnd.randrange(1000))
+	return UploadCache().load_bytes('test.csv', text.encode(csvio.ENCODING)), keys
+
+
+def change(rnd, hours_by_project, other):
+	"""Changes a target or an activity minimum of the form at random"""
+	if rnd.random() < 0.2:
+		other[rnd.choice(list(ACTIVITY_CODES))] = rnd.choice([-1, 0, 0.5, 1, 2])
+	else:
+		key = rnd.choice(list(hours_by_project))
+		hours_by_project[key] = rnd.choice([-1, 0, rnd.randint(0, 12) / 2, rnd.uniform(0, 60)])
+
+
+@pytest.mark.parametrize("case", range(CASES))
+def test_incremental_matches_full(case):
+	rnd = random.Random(case)
+	upload, keys = random_upload(rnd)
+	state = PreviewState(upload, seed=case)
+	hours_by_project = make_targets(keys, free_hours=7.5 * upload.num_working_days, load=rnd.uniform(0.2, 0.9),
+									seed=case)
+	other = {key: -1 for key in ACTIVITY_CODES}
+	fill = rnd.choice(list(FILL_STRATEGIES))
+	shown = None
+	for _ in range(STEPS):
+		change(rnd, hours_by_project, other)
+		try:
+			full = state.full(other, hours_by_project, fill=fill)
+		except SolverException as e:
+			full = str(e)
+		# the version of the last answer, or one the state did not give, as another worker or an empty table
+		version = state.version if rnd.random() < 0.8 else rnd.choice([None, 'otra'])
+		try:
+			changed, hours = state.solve(other, hours_by_project, fill=fill, version=version)
+		except SolverException as e:
+			assert str(e) == full
+			continue
+		assert not isinstance(full, str), full
+		np.testing.assert_allclose(hours, full, atol=1e-9)
+
+		totals = hours.sum(axis=1)
+		if shown is None or version is None or version == 'otra':
+			assert changed == list(range(len(totals)))
+			shown = np.zeros(len(totals))
+		shown[changed] = totals[changed]
+		np.testing.assert_allclose(shown, totals, atol=1e-9)
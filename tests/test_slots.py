@@ -0,0 +1,100 @@
+"""Randomized checks of the slot allocation mode, see engine.solve_slots.
+
+Every case builds a sheet with random projects, targets, prefilled activity
+hours and slot rules, solves it and checks the rules on the hours added. The
+targets are cut to what fits first, so every case is solved; targets over the
+free slots of the sheet must raise SolverException.
+"""
+import random
+
+import numpy as np
+import pytest
+
+from engine import FILL_STRATEGIES, SlotRules, SolverException, row_targets, solve_matrix
+
+CASES = 600
+TOLERANCE = 1e-6
+
+
+def random_case(rnd):
+	"""Returns the hours, row keys, hours_by_project, daily max and rules of a random sheet"""
+	days, daily_max = rnd.randint(1, 30), rnd.choice([6.0, 7.5, 8.0])
+	slot = rnd.choice([0.25, 0.5, 1.0])
+	min_block, max_block = rnd.choice([0, 0.5, 1, 2, 3]), rnd.choice([None, 2, 3, 4, 7.5])
+	if max_block is not None and max_block < max(min_block, slot):
+		max_block = None
+	max_projects = rnd.choice([None, 1, 2, 3])
+	rules = SlotRules(slot, min_block, max_block, max_projects)
+
+	keys = list(dict.fromkeys((f"P{i}", rnd.choice([-1, 1, 2])) for i in range(rnd.randint(1, 8))))
+	row_keys = keys + [("Otras Actividades", -1)] * 2
+	hours = np.zeros((len(row_keys), days))
+	# activity hours already in the sheet, not multiples of the slot
+	for day in range(days):
+		if rnd.random() < 0.4:
+			hours[len(keys), day] = rnd.choice([1, 1.3, 2.25, 3])
+	if max_projects is None and rnd.random() < 0.3:
+		hours[0, rnd.randrange(days)] = 1.0
+	hours_by_project = {key: rnd.choice([-1, 0, rnd.uniform(0, 40)]) for key in keys}
+	return hours, row_keys, hours_by_project, daily_max, rules
+
+
+def fit_targets(hours, row_keys, hours_by_project, daily_max, rules):
+	"""Returns the targets halved, in row order, until they fit after the rows before them.
+
+	The targets are placed in row order before the fill, so a target fits when
+	the solve with it and the targets of the rows before it does.
+	"""
+	fitted = {key: -1 if target == -1 else 0 for key, target in hours_by_project.items()}
+	for key, target in hours_by_project.items():
+		need = 0 if target == -1 else int(round(target / rules.slot))
+		while need > 0:
+			fitted[key] = need * rules.slot
+			try:
+				solve_matrix(hours, row_keys, fitted, daily_max=daily_max, slots=rules)
+				break
+			except SolverException:
+				need //= 2
+		fitted[key] = -1 if target == -1 else need * rules.slot
+	return fitted
+
+
+def free_slots(hours, daily_max, rules):
+	return int(np.floor((daily_max - hours.sum(axis=0)) / rules.slot + TOLERANCE).clip(0).sum())
+
+
+@pytest.mark.parametrize("case", range(CASES))
+def test_slot_rules(case):
+	rnd = random.Random(case)
+	hours, row_keys, hours_by_project, daily_max, rules = random_case(rnd)
+	hours_by_project = fit_targets(hours, row_keys, hours_by_project, daily_max, rules)
+	solved = solve_matrix(hours, row_keys, hours_by_project, daily_max=daily_max, rng=random.Random(case),
+						  fill=rnd.choice(list(FILL_STRATEGIES)), slots=rules)
+	added = solved - hours
+	num_projects = len(hours_by_project)
+	projects = added[:num_projects]
+	low, high = rules.block_slots()
+
+	assert (added >= -TOLERANCE).all()
+	assert (added[num_projects:] == 0).all()
+	slots = added / rules.slot
+	assert np.allclose(slots, np.round(slots), atol=TOLERANCE), "hours in whole slots"
+	assert (solved.sum(axis=0) <= daily_max + TOLERANCE).all(), "daily cap"
+	assert (projects[projects > TOLERANCE] >= low * rules.slot - TOLERANCE).all(), "min block"
+	if high is not None:
+		assert (projects[projects > TOLERANCE] <= high * rules.slot + TOLERANCE).all(), "max block"
+	if rules.max_projects is not None:
+		assert ((solved[:num_projects] > 0).sum(axis=0) <= rules.max_projects).all(), "max projects per day"
+	for index, target in enumerate(row_targets(row_keys, hours_by_project)):
+		if target is not None:
+			assert added[index].sum() == pytest.approx(round(target / rules.slot) * rules.slot, abs=TOLERANCE), "target"
+
+
+@pytest.mark.parametrize("case", range(0, CASES, 10))
+def test_targets_over_free_slots(case):
+	rnd = random.Random(case)
+	hours, row_keys, hours_by_project, daily_max, rules = random_case(rnd)
+	key = next(iter(hours_by_project))
+	hours_by_project[key] = (free_slots(hours, daily_max, rules) + 1) * rules.slot
+	with pytest.raises(SolverException):
+		solve_matrix(hours, row_keys, hours_by_project, daily_max=daily_max, rng=random.Random(case), slots=rules)
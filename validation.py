@@ -0,0 +1,113 @@
+"""Checks of a sheet on its rows x working days matrix.
+
+The daily totals, the totals of every activity and the weekly sums are
+computed at once with numpy, and every daily, weekly and monthly problem is
+reported instead of only the first one.
+"""
+import numpy as np
+
+from engine import ACTIVITY_CODES, EPSILON, MAX_HOUR_DAY, MAX_HOUR_WEEK
+
+DAILY = "daily"
+WEEKLY = "weekly"
+MONTHLY = "monthly"
+
+# activities listed in the monthly message, in this order
+MONTHLY_ACTIVITIES = [(97, "docencia"), (98, "otras actividades de I+D"), (100, "otras actividades"),
+					  (108, "formación del participante")]
+
+
+class Violation:
+	"""A limit exceeded in a day, an ISO week or the whole month"""
+
+	def __init__(self, kind, period, hours, limit, message):
+		self.kind = kind
+		self.period = period
+		self.hours = hours
+		self.limit = limit
+		self.message = message
+
+	def to_dict(self):
+		return {'kind': self.kind, 'period': self.period, 'hours': self.hours, 'limit': self.limit,
+				'message': self.message}
+
+
+class RowIndex:
+	"""Boolean masks of the rows of every activity id, built once per sheet"""
+
+	def __init__(self, _activity_ids):
+		ids = np.asarray(_activity_ids)
+		self.masks = {code: ids == code for code in np.unique(ids).tolist()}
+		self.empty = np.zeros(len(ids), dtype=bool)
+
+	def mask(self, code):
+		return self.masks.get(code, self.empty)
+
+	def totals(self, _hours):
+		"""Returns the hours of every activity id in an hours matrix"""
+		row_totals = _hours.sum(axis=1)
+		return {code: float(row_totals[mask].sum()) for code, mask in self.masks.items()}
+
+
+def apply_minimums(_hours, _rows, _other_activities, daily_max=MAX_HOUR_DAY):
+	"""Raises the activity rows to the per-day minimums, in place, without going over the free hours of each day.
+
+	Activities are served in the order of ACTIVITY_CODES; every row of an
+	activity gets the missing hours, as check_hours always did.
+	"""
+	available = np.maximum(0.0, daily_max - _hours.sum(axis=0))
+	for activity_key, activity_code in ACTIVITY_CODES.items():
+		value = _other_activities.get(activity_key, -1)
+		if value == -1:
+			continue
+		mask = _rows.mask(activity_code)
+		need = np.maximum(0.0, float(value) - _hours[mask].sum(axis=0))
+		alloc = np.minimum(need, available)
+		_hours[mask] += alloc
+		available -= alloc
+	return _hours
+
+
+def week_index(_weeks):
+	"""Returns the distinct ISO weeks in order and the position of the week of every day"""
+	keys = list(dict.fromkeys(_weeks))
+	position = {key: i for i, key in enumerate(keys)}
+	return keys, np.array([position[week] for week in _weeks], dtype=int)
+
+
+def monthly_message(_num_working_days, _activity_totals):
+	msg = f"Te has pasado de horas.\nEl máximo es de {MAX_HOUR_DAY}h al día y {MAX_HOUR_DAY * _num_working_days} horas este mes.\n"
+	for code, name in MONTHLY_ACTIVITIES:
+		if _activity_totals.get(code, 0) > 0:
+			msg += f"Has asignado {_activity_totals[code]} horas de {name}\n"
+	return msg
+
+
+def find_violations(_hours, _working_days, _weeks, _num_working_days, _requested, daily_max=MAX_HOUR_DAY,
+					weekly_max=MAX_HOUR_WEEK, activity_totals=None):
+	"""Returns every monthly, daily and weekly violation of an hours matrix, in that order.
+
+	``_requested`` are the project hours asked for, which must fit in the free
+	hours of the month. ``activity_totals`` are the hours of every activity id
+	shown in the monthly message.
+	"""
+	violations = []
+	day_totals = _hours.sum(axis=0)
+
+	max_hours_month = max(0.0, daily_max * _num_working_days - float(day_totals.sum()))
+	if _requested > max_hours_month + EPSILON:
+		violations.append(Violation(MONTHLY, None, _requested, max_hours_month,
+									monthly_message(_num_working_days, activity_totals or {})))
+
+	for index in np.flatnonzero(day_totals > daily_max + EPSILON):
+		day, total = _working_days[index], float(day_totals[index])
+		violations.append(Violation(DAILY, day, total, daily_max,
+									f"Se han asignado {total}h el día {day}, que supera el máximo diario de {daily_max}h."))
+
+	keys, days_week = week_index(_weeks)
+	week_totals = np.bincount(days_week, weights=day_totals, minlength=len(keys))
+	for index in np.flatnonzero(week_totals > weekly_max + EPSILON):
+		(year, week), total = keys[index], float(week_totals[index])
+		violations.append(Violation(WEEKLY, f"{year}-W{week}", total, weekly_max,
+									f"Semana {year}-W{week} tiene {total}h asignadas, que supera el máximo semanal de {weekly_max}h."))
+	return violations
@@ -0,0 +1,192 @@
+"""Working-day calendars: weekends, holidays and personal absences.
+
+Holidays are read from ``.ics`` files (the dates of every VEVENT, yearly
+events repeat every year) or ``.csv`` files (a date in the first column). The
+files in the HOLIDAYS environment variable, separated by ``os.pathsep``, apply
+to every sheet. Absences are read from the ``;`` separated CSV in ABSENCES,
+with the columns ``DNI``, ``Desde`` and ``Hasta``, and only apply to the
+sheets of that person.
+
+The working days of a range are computed once per range and person and kept
+as a ``DayIndex``, with the ISO week of every day.
+"""
+import csv
+import datetime
+import functools
+import os
+
+import numpy as np
+
+CALENDAR_CACHE = 1024
+ABSENCE_CODE = 99
+
+
+def day_label(_date):
+	"""Returns a date as d/m/yy, the format of the working days"""
+	return f"{_date.day}/{_date.month}/{_date.year % 100:02d}"
+
+
+def label_date(_label):
+	"""Returns the date of a d/m/yy label"""
+	day, month, year = _label.split('/')
+	return datetime.date(2000 + int(year), int(month), int(day))
+
+
+@functools.lru_cache(maxsize=4096)
+def iso_week(_label):
+	"""Returns the ISO (year, week) of a d/m/yy label"""
+	day, month, year = _label.split('/')
+	iso = datetime.date(2000 + int(year), int(month), int(day)).isocalendar()
+	return iso[0], iso[1]
+
+
+def parse_date(_text):
+	"""Parses the dates of holiday and absence files: YYYYMMDD, ISO or day first"""
+	text = _text.strip()
+	if len(text) >= 8 and text[:8].isdigit():
+		return datetime.date(int(text[:4]), int(text[4:6]), int(text[6:8]))
+	if len(text) == 10 and text[4] == '-':
+		return datetime.date.fromisoformat(text)
+	import dateutil.parser as parser
+
+	return parser.parse(text, dayfirst=True).date()
+
+
+def read_ics(_file):
+	"""Returns the single dates and the yearly (month, day) dates of the events of an iCalendar file"""
+	dates, yearly = set(), set()
+	lines = []
+	for line in _file.read().splitlines():
+		# unfold continuation lines
+		if line[:1] in (' ', '\t') and lines:
+			lines[-1] += line[1:]
+		else:
+			lines.append(line)
+	event = None
+	for line in lines:
+		name, _, value = line.partition(':')
+		name = name.split(';')[0].upper()
+		if name == 'BEGIN' and value.upper() == 'VEVENT':
+			event = {}
+		elif name == 'END' and value.upper() == 'VEVENT' and event is not None:
+			if 'DTSTART' in event:
+				start = parse_date(event['DTSTART'])
+				end = parse_date(event['DTEND']) if 'DTEND' in event else start + datetime.timedelta(days=1)
+				days = [start + datetime.timedelta(days=i) for i in range(max(1, (end - start).days))]
+				if 'FREQ=YEARLY' in event.get('RRULE', '').upper():
+					yearly.update((day.month, day.day) for day in days)
+				else:
+					dates.update(days)
+			event = None
+		elif event is not None:
+			event[name] = value
+	return dates, yearly
+
+
+def read_holidays(_path):
+	"""Returns the single and yearly holidays of an .ics or .csv file"""
+	with open(_path, encoding='utf-8-sig') as f:
+		if _path.lower().endswith('.ics'):
+			return read_ics(f)
+		text = f.read()
+	dates = set()
+	for row in csv.reader(text.splitlines(), delimiter=';' if ';' in text else ','):
+		try:
+			dates.add(parse_date(row[0]))
+		except (IndexError, ValueError, OverflowError):
+			# header or empty line
+			continue
+	return dates, set()
+
+
+def read_absences(_path):
+	"""Returns the absent days of every person: {dni: {date}}"""
+	absences = {}
+	with open(_path, encoding='utf-8-sig') as f:
+		for row in csv.DictReader(f, delimiter=';'):
+			start = parse_date(row['Desde'])
+			end = parse_date(row['Hasta'] or row['Desde'])
+			days = absences.setdefault(str(row['DNI']).strip(), set())
+			days.update(start + datetime.timedelta(days=i) for i in range((end - start).days + 1))
+	return absences
+
+
+class DayIndex:
+	"""The days of a range of dates, which of them are working days and their ISO weeks"""
+
+	def __init__(self, dates, working):
+		self.dates = dates
+		self.labels = [day_label(date) for date in dates]
+		self.working = np.array(working, dtype=bool)
+		self.days = [label for label, w in zip(self.labels, working) if w]
+		self.weeks = [iso_week(label) for label in self.days]
+
+
+class Calendar:
+	"""Weekends, holidays and personal absences, with the working days of every range cached"""
+
+	def __init__(self, holidays=(), yearly=(), absences=None, cache_size=CALENDAR_CACHE):
+		self.holidays = frozenset(holidays)
+		self.yearly = frozenset(yearly)
+		self.absences = {dni: frozenset(days) for dni, days in (absences or {}).items()}
+		self.index = functools.lru_cache(maxsize=cache_size)(self._index)
+
+	@classmethod
+	def from_env(cls):
+		holidays, yearly = set(), set()
+		for path in filter(None, os.environ.get('HOLIDAYS', '').split(os.pathsep)):
+			dates, repeated = read_holidays(path)
+			holidays |= dates
+			yearly |= repeated
+		absences = read_absences(os.environ['ABSENCES']) if os.environ.get('ABSENCES') else None
+		return cls(holidays, yearly, absences)
+
+	def is_working(self, _date, dni=None):
+		return (_date.weekday() < 5 and _date not in self.holidays and (_date.month, _date.day) not in self.yearly
+				and _date not in self.absences.get(dni, ()))
+
+	def _index(self, _first_date, _last_date, dni=None):
+		# DayIndex of a range, built once per range and person by self.index
+		dni = None if dni is None else str(dni).strip()
+		dates = [_first_date + datetime.timedelta(days=i) for i in range((_last_date - _first_date).days + 1)]
+		return DayIndex(dates, [self.is_working(date, dni) for date in dates])
+
+
+_calendar = None
+
+
+def get_calendar():
+	"""Returns the calendar of the HOLIDAYS and ABSENCES files, loading it on first use"""
+	global _calendar
+	if _calendar is None:
+		_calendar = Calendar.from_env()
+	return _calendar
+
+
+def set_calendar(calendar):
+	global _calendar
+	_calendar = calendar
+
+
+def absent_columns(_hours, _activity_ids, daily_max):
+	"""Returns a mask of the day columns of an hours matrix whose activity-99 (Ausencias/Vacaciones) hours fill the whole day"""
+	rows = np.asarray(_activity_ids) == ABSENCE_CODE
+	return np.nansum(_hours[rows], axis=0) >= daily_max - 1e-6
+
+
+def absent_days(_df, _days, daily_max):
+	"""Returns the days of a frame whose activity-99 (Ausencias/Vacaciones) hours fill the whole day"""
+	import pandas as pd
+
+	rows = _df[_df['Id Actividad'] == ABSENCE_CODE]
+	if rows.empty:
+		return set()
+	cells = rows[_days]
+	try:
+		hours = cells.to_numpy(dtype=float)
+	except (TypeError, ValueError):
+		# comma decimals and empty cells, converted all at once
+		text = pd.Series(cells.astype(str).to_numpy().ravel()).str.replace(',', '.', regex=False)
+		hours = pd.to_numeric(text, errors='coerce').to_numpy(dtype=float).reshape(cells.shape)
+	absent = absent_columns(hours, np.full(len(hours), ABSENCE_CODE), daily_max)
+	return {day for day, full in zip(_days, absent) if full}
@@ -0,0 +1,53 @@
+"""Production entry point, served with ``gunicorn -c gunicorn.conf.py wsgi:app``.
+
+``create_app()`` takes the Flask app of index.py without template reloading
+and loads once what the first requests would otherwise pay for: the compiled
+templates, the working calendar, the modules loaded on first use (the HTML
+renderer and scipy) and the last used uploads, parsed into the uploads cache.
+gunicorn runs it in the master process before forking
+(``preload_app``), so the workers start ready and share that memory.
+
+The solve jobs are also kept in JOB_DB, so any worker process answers the
+job pages; see gunicorn.conf.py for how to set WEB_WORKERS and WEB_THREADS.
+"""
+import importlib
+import os
+
+import index
+from cache import uploads
+from workcalendar import get_calendar
+
+PRELOAD_UPLOADS = 16
+# loaded on first use by the result page and the exact solver
+PRELOAD_MODULES = ['pretty_html_table', 'scipy.optimize', 'scipy.sparse']
+
+
+def create_app():
+	"""Returns the app with its templates, calendar and recent uploads loaded, ready to serve"""
+	app = index.app
+	app.config['TEMPLATES_AUTO_RELOAD'] = False
+	app.jinja_env.auto_reload = False
+	for name in app.jinja_env.list_templates():
+		app.jinja_env.get_template(name)
+	get_calendar()
+	for module in PRELOAD_MODULES:
+		try:
+			importlib.import_module(module)
+		except ImportError:
+			pass
+	for digest in index.upload_files.recent(int(os.environ.get('PRELOAD_UPLOADS', PRELOAD_UPLOADS))):
+		try:
+			uploads.load(index.upload_files.path(digest))
+		except Exception as e:
+			print(f'Preload of upload {digest} failed:', e)
+	app.config['READY'] = True
+	return app
+
+
+def shutdown(app, wait=True):
+	"""Stops answering ready and waits for the running solve jobs"""
+	app.config['READY'] = False
+	index.solve_jobs.shutdown(wait=wait)
+
+
+app = create_app()